@@ -0,0 +1,100 @@
+import threading
+import time
+
+import numpy as np
+
+# ─────────────────────────────────────────────
+# Semantic answer cache
+# ─────────────────────────────────────────────
+#
+# Stores (query embedding, language, answer + its sources, index version). A new question
+# reuses a cached answer when its embedding is close enough (cosine) to one
+# that was already answered in the same language against the same index.
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 86400, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors = None        # (n, dim) float32, unit-normalized rows
+        self._entries = []          # dicts aligned with _vectors rows
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def _drop(self, keep: np.ndarray):
+        self._vectors = self._vectors[keep] if keep.any() else None
+        self._entries = [e for e, k in zip(self._entries, keep) if k]
+
+    def _evict_expired(self, now: float):
+        if not self._entries:
+            return
+        keep = np.array([now - e["created_at"] < self.ttl_seconds for e in self._entries])
+        if not keep.all():
+            self._drop(keep)
+
+    def lookup(self, embedding, language: str, index_version):
+        """Return (answer, sources) cached for a semantically equivalent question, or None."""
+        q = self._unit(embedding)
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            sims = self._vectors @ q
+            eligible = np.array([
+                e["language"] == language and e["index_version"] == index_version
+                for e in self._entries
+            ])
+            sims = np.where(eligible, sims, -1.0)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best]
+            entry["last_used"] = now
+            self.hits += 1
+            print(f"⚡ Answer cache hit (similarity {sims[best]:.3f})")
+            return entry["answer"], entry["sources"]
+
+    def store(self, embedding, language: str, answer: str, index_version, sources: list = ()):
+        if self.max_entries <= 0:
+            return
+        v = self._unit(embedding)
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            if self._vectors is not None and len(self._entries) >= self.max_entries:
+                # Size limit: drop the least recently used entry
+                lru = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                keep = np.ones(len(self._entries), dtype=bool)
+                keep[lru] = False
+                self._drop(keep)
+
+            self._vectors = v[None, :] if self._vectors is None else np.vstack([self._vectors, v])
+            self._entries.append({
+                "language": language,
+                "answer": answer,
+                "sources": list(sources),
+                "index_version": index_version,
+                "created_at": now,
+                "last_used": now,
+            })
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,4 +1,11 @@
-from embedding.embedding import build_or_load_vectorstore, retrieve
+from embedding.embedding import (
+    build_or_load_vectorstore,
+    retrieve,
+    embed_query,
+    detect_language,
+    get_index_version,
+)
+from chating.answer_cache import SemanticAnswerCache
 from langchain_groq import ChatGroq
 import os
 from dotenv import load_dotenv
@@ -14,6 +21,14 @@ if not GROQ_API_KEY:
 
 vector_store = None
 
+# Semantic answer cache: paraphrases of an already answered question (cosine
+# >= ANSWER_CACHE_THRESHOLD, same language, same index) skip retrieval + LLM.
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+)
+
 
 # LLM
 llm = ChatGroq(
@@ -34,11 +49,32 @@ llm = ChatGroq(
 #     timeout=None,
 #     max_retries=2,
 # )
-def ask_llm(query):
+def prepare_chat(query):
+    """
+    CPU-bound part of a chat turn: answer-cache lookup, retrieval, prompt.
+
+    Returns a dict with either "answer" set (cache hit / nothing found) or
+    "prompt" set for the LLM call; "sources" lists the sources the answer is
+    (or was, for a cache hit) built from.
+    """
     global vector_store
     if vector_store is None:
         vector_store = build_or_load_vectorstore()
-    
+
+    prepared = {
+        "query": query,
+        "embedding": embed_query(query),
+        "language": detect_language(query),
+        "index_version": get_index_version(),
+        "docs": [],
+        "sources": [],
+        "prompt": None,
+        "answer": None,
+    }
+    cached = answer_cache.lookup(prepared["embedding"], prepared["language"], prepared["index_version"])
+    if cached is not None:
+        prepared["answer"], prepared["sources"] = cached
+        return prepared
     
     # Retrieve relevant documents (20 chunks gives LLM enough context while
     # keeping latency manageable)
@@ -47,8 +83,78 @@ def ask_llm(query):
     # print(f"Retrieved documents: {context_docs}")
     # print("\n\n")    
     if not context_docs:
-        return "I'm sorry, I couldn't find any relevant information."
-    
+        prepared["answer"] = "I'm sorry, I couldn't find any relevant information."
+        return prepared
+
+    prepared["docs"] = context_docs
+    prepared["sources"] = answer_sources(context_docs)
+    prepared["prompt"] = build_prompt(query, context_docs)
+    return prepared
+
+
+def remember_answer(prepared, answer):
+    """Store a freshly generated answer in the semantic cache and return it."""
+    answer_cache.store(
+        prepared["embedding"], prepared["language"], answer, prepared["index_version"], prepared["sources"]
+    )
+    return answer
+
+
+def answer_sources(docs):
+    """Unique sources of the retrieved chunks, in retrieval order."""
+    seen, sources = set(), []
+    for doc in docs:
+        name = doc.metadata.get("page_name") or doc.metadata.get("source_pdf")
+        if name in seen:
+            continue
+        seen.add(name)
+        sources.append({
+            "source_type": doc.metadata.get("source_type"),
+            "page_name": doc.metadata.get("page_name"),
+            "source_pdf": doc.metadata.get("source_pdf"),
+        })
+    return sources
+
+
+def ask_llm(query):
+    prepared = prepare_chat(query)
+    if prepared["answer"] is not None:
+        return prepared["answer"]
+
+    try:
+        ai_msg = llm.invoke(prepared["prompt"])
+        return remember_answer(prepared, ai_msg.content)
+    except Exception as e:
+        return f"Fehler beim Abrufen der Antwort: {str(e)}"
+
+
+async def agenerate_answer(prepared):
+    """Non-blocking LLM call for a prepare_chat() result."""
+    if prepared["answer"] is not None:
+        return prepared["answer"]
+
+    try:
+        ai_msg = await llm.ainvoke(prepared["prompt"])
+        return remember_answer(prepared, ai_msg.content)
+    except Exception as e:
+        return f"Fehler beim Abrufen der Antwort: {str(e)}"
+
+
+async def astream_answer(prepared):
+    """Yield answer text pieces as the LLM produces them; the full answer is cached at the end."""
+    if prepared["answer"] is not None:
+        yield prepared["answer"]
+        return
+
+    parts = []
+    async for chunk in llm.astream(prepared["prompt"]):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
+    remember_answer(prepared, "".join(parts))
+
+
+def build_prompt(query, context_docs):
     # Convert documents to text
     context = "\n\n".join([doc.page_content for doc in context_docs])
     
@@ -134,11 +240,6 @@ ANSWER:
 
 """.strip()
 
-    
-    try:
-        ai_msg = llm.invoke(prompt)
-        return ai_msg.content
-    except Exception as e:
-        return f"Fehler beim Abrufen der Antwort: {str(e)}"
+    return prompt
 
 
@@ -0,0 +1,89 @@
+import os
+
+import faiss
+import numpy as np
+
+# ─────────────────────────────────────────────
+# FAISS index types
+# ─────────────────────────────────────────────
+#
+#   flat   — exact search (IndexFlatL2), 4·dim bytes per vector
+#   hnsw   — graph index (IndexHNSWFlat): sub-linear search, same vector storage
+#            plus the graph; cannot delete, so updates rebuild it
+#   ivfpq  — inverted lists + product quantization (IndexIVFPQ): PQ_M bytes
+#            per vector, approximate distances
+#
+# All types use L2 on the unit-normalized embeddings, so LangChain's
+# relevance scores keep their meaning. The parameters an index was built with
+# are stored next to it (index_params.json).
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").strip().lower()
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))          # 0 → ~4·sqrt(n)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("PQ_M", "48"))                   # sub-quantizers; must divide the dimension
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+
+# k-means wants roughly this many training points per centroid
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def configured_params() -> dict:
+    """Index parameters requested through the environment."""
+    if INDEX_TYPE not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE {INDEX_TYPE!r} (expected one of {', '.join(INDEX_TYPES)})")
+    if INDEX_TYPE == "hnsw":
+        return {"type": "hnsw", "m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, "ef_search": HNSW_EF_SEARCH}
+    if INDEX_TYPE == "ivfpq":
+        return {"type": "ivfpq", "nlist": IVF_NLIST, "nprobe": IVF_NPROBE, "pq_m": PQ_M, "pq_nbits": PQ_NBITS}
+    return {"type": "flat"}
+
+
+def build_index(vectors: np.ndarray, params: dict) -> tuple:
+    """
+    Build a FAISS index of `params["type"]` over `vectors`.
+
+    Returns (index, effective params) — IVF-PQ falls back to flat when there
+    are too few vectors to train the product quantizer, and an automatic
+    nlist is resolved to the value actually used.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    kind = params["type"]
+
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.add(vectors)
+        index.hnsw.efSearch = params["ef_search"]
+        return index, dict(params)
+
+    if kind == "ivfpq":
+        if n < 2 ** params["pq_nbits"] or dim % params["pq_m"]:
+            print(f"    ⚠️  IVF-PQ needs ≥ {2 ** params['pq_nbits']} vectors and pq_m dividing {dim} "
+                  f"(have {n}, pq_m={params['pq_m']}) — using a flat index")
+            return build_index(vectors, {"type": "flat"})
+        nlist = params["nlist"] or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n // _MIN_POINTS_PER_CENTROID))
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, params["pq_m"], params["pq_nbits"])
+        index.train(vectors)
+        index.add(vectors)
+        index.nprobe = min(params["nprobe"], nlist)
+        return index, {**params, "nlist": nlist, "nprobe": index.nprobe}
+
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    return index, {"type": "flat"}
+
+
+def set_search_params(index, params: dict):
+    """Apply query-time knobs (efSearch / nprobe) to a loaded index."""
+    if params.get("type") == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = params["ef_search"]
+    elif params.get("type") == "ivfpq":
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
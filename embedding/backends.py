@@ -0,0 +1,79 @@
+import os
+import shutil
+
+# ─────────────────────────────────────────────
+# Inference backends for the embedding model and the CrossEncoder
+# ─────────────────────────────────────────────
+#
+#   torch     — sentence-transformers default (full-precision PyTorch)
+#   onnx      — ONNX Runtime, fp32
+#   onnx-int8 — ONNX Runtime with dynamic int8 quantization
+#
+# ONNX exports are written once to ONNX_CACHE_DIR/<model>-onnx/ and loaded
+# from there afterwards. Needs `pip install "sentence-transformers[onnx]"`.
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", EMBEDDING_BACKEND).strip().lower()
+
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "data/models")
+
+# Quantization preset of sentence_transformers.export_dynamic_quantized_onnx_model:
+# "avx2" (any x86-64), "avx512", "avx512_vnni" or "arm64"
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")
+
+
+def _onnx_file(backend: str) -> str:
+    if backend == "onnx-int8":
+        return f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+    return "onnx/model.onnx"
+
+
+def _cache_dir(model_name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "__") + "-onnx")
+
+
+def _export(model_cls, model_name: str, backend: str, target: str):
+    """Export `model_name` to ONNX (and quantize it for onnx-int8) into `target`."""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    print(f"\n📤 Exporting {model_name} to ONNX ({backend}) → {target} ...")
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    if not os.path.exists(os.path.join(target, "onnx", "model.onnx")):
+        model = model_cls(model_name, backend="onnx", device="cpu")
+        model.save_pretrained(tmp)
+    else:
+        # fp32 export is cached already — only the quantized file is missing
+        shutil.copytree(target, tmp)
+        model = model_cls(tmp, backend="onnx", device="cpu")
+
+    if backend == "onnx-int8":
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, tmp)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    print("    ✅ Export cached")
+
+
+def resolve_model(model_cls, model_name: str, backend: str) -> tuple:
+    """
+    Return (name_or_path, constructor kwargs) to load `model_name` with `backend`.
+
+    `model_cls` is SentenceTransformer or CrossEncoder; it is used to export
+    the model the first time an ONNX backend is requested.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r} (expected one of {', '.join(BACKENDS)})")
+    if backend == "torch":
+        return model_name, {}
+
+    target = _cache_dir(model_name)
+    file_name = _onnx_file(backend)
+    if not os.path.exists(os.path.join(target, file_name)):
+        os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+        _export(model_cls, model_name, backend, target)
+
+    return target, {"backend": "onnx", "model_kwargs": {"file_name": file_name}}
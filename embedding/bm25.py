@@ -0,0 +1,167 @@
+import os
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+# ─────────────────────────────────────────────
+# Vectorized BM25+ (replacement for rank_bm25.BM25Plus)
+# ─────────────────────────────────────────────
+#
+# Same scoring as rank_bm25.BM25Plus behind langchain's BM25Retriever
+# (whitespace tokenization, idf = log((N + 1) / df)), but the per-term
+# document weights are precomputed once into a CSR term × document matrix.
+# A query is then one sparse mat-vec + argpartition instead of a Python
+# loop over every document.
+
+K1 = 1.5
+B = 0.75
+DELTA = 1.0
+
+
+def tokenize(text: str) -> list:
+    """Same preprocessing as langchain's BM25Retriever (plain whitespace split)."""
+    return text.split()
+
+
+def _join(strings) -> np.ndarray:
+    # Tokens / ids never contain newlines, so a joined utf-8 blob is a compact,
+    # pickle-free way to store them in the .npz
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _split(blob: np.ndarray) -> list:
+    text = blob.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class BM25PlusIndex:
+    """
+    Immutable BM25+ index over a list of texts.
+
+    `ids` are the caller's document ids (FAISS docstore ids); search() returns
+    (id, score) pairs, so no Document objects are held here.
+    """
+
+    def __init__(self, ids, vocab, matrix, idf, k1=K1, b=B, delta=DELTA):
+        self.ids = list(ids)
+        self.vocab = vocab                  # term → row in matrix
+        self.matrix = matrix                # CSR, terms × docs, BM25 tf weights
+        self.idf = idf                      # per-term idf
+        self.k1, self.b, self.delta = k1, b, delta
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_texts(cls, texts, ids, k1=K1, b=B, delta=DELTA):
+        vocab = {}
+        rows, cols, tfs = [], [], []
+        doc_len = np.zeros(len(texts), dtype=np.float64)
+
+        for d, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[d] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                rows.append(vocab.setdefault(term, len(vocab)))
+                cols.append(d)
+                tfs.append(tf)
+
+        n_docs = len(texts)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        tfs = np.asarray(tfs, dtype=np.float64)
+
+        avgdl = doc_len.sum() / n_docs if n_docs else 0.0
+        df = np.bincount(rows, minlength=len(vocab)).astype(np.float64)
+        idf = np.log((n_docs + 1) / df) if len(vocab) else np.zeros(0)
+
+        # Same expression (and evaluation order) as BM25Plus.get_scores
+        norm = k1 * (1 - b + b * doc_len / avgdl) if n_docs else doc_len
+        weights = (tfs * (k1 + 1)) / (norm[cols] + tfs)
+
+        matrix = sparse.csr_matrix(
+            (weights, (rows, cols)),
+            shape=(len(vocab), n_docs),
+        )
+        return cls(ids, vocab, matrix, idf, k1, b, delta)
+
+    def get_scores(self, query: str) -> np.ndarray:
+        """BM25+ score of every document for `query` (repeated terms count repeatedly)."""
+        counts = Counter(t for t in tokenize(query) if t in self.vocab)
+        if not counts:
+            return np.zeros(len(self.ids))
+
+        terms = np.fromiter((self.vocab[t] for t in counts), dtype=np.int64, count=len(counts))
+        q_weights = self.idf[terms] * np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+
+        scores = self.matrix[terms].T @ q_weights
+        # BM25+ lower bound: every document gets idf * delta for each query term
+        return np.asarray(scores).ravel() + self.delta * q_weights.sum()
+
+    def matches(self, query: str) -> np.ndarray:
+        """Boolean mask of the documents containing at least one query term."""
+        terms = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not terms:
+            return np.zeros(len(self.ids), dtype=bool)
+        return np.asarray(self.matrix[terms].getnnz(axis=0)).ravel() > 0
+
+    def search(self, query: str, k: int, matched_only: bool = False) -> list:
+        """
+        Top-k documents as [(id, score), ...], best first (ties → lower row first).
+
+        matched_only=True leaves out documents without any query term (BM25+
+        still gives those the delta floor score).
+        """
+        n_docs = len(self.ids)
+        if k <= 0 or n_docs == 0:
+            return []
+
+        scores = self.get_scores(query)
+        pool = np.flatnonzero(self.matches(query)) if matched_only else np.arange(n_docs)
+        if k < len(pool):
+            # k-th best score via argpartition, then keep everything tied with it
+            # so the tie-break below is deterministic
+            kth = scores[pool][np.argpartition(-scores[pool], k - 1)[k - 1]]
+            top = pool[scores[pool] >= kth]
+        else:
+            top = pool
+        top = top[np.lexsort((top, -scores[top]))][:k]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    # ─────────────────────────────────────────
+    # Persistence (.npz, no pickle)
+    # ─────────────────────────────────────────
+
+    def save(self, path: str, fingerprint: str = ""):
+        vocab_terms = sorted(self.vocab, key=self.vocab.get)
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp,
+            fingerprint=np.array(fingerprint),
+            params=np.array([self.k1, self.b, self.delta]),
+            shape=np.array(self.matrix.shape, dtype=np.int64),
+            indptr=self.matrix.indptr,
+            indices=self.matrix.indices,
+            data=self.matrix.data,
+            idf=self.idf,
+            vocab=_join(vocab_terms),
+            ids=_join(self.ids),
+        )
+        os.replace(tmp, path)
+
+    @staticmethod
+    def read_fingerprint(path: str) -> str:
+        with np.load(path, allow_pickle=False) as z:
+            return str(z["fingerprint"])
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as z:
+            matrix = sparse.csr_matrix(
+                (z["data"], z["indices"], z["indptr"]),
+                shape=tuple(z["shape"]),
+            )
+            vocab = {t: i for i, t in enumerate(_split(z["vocab"]))}
+            k1, b, delta = z["params"].tolist()
+            return cls(_split(z["ids"]), vocab, matrix, z["idf"], k1, b, delta)
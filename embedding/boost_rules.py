@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# ─────────────────────────────────────────────
+# Declarative ranking boosts (reranker off)
+# ─────────────────────────────────────────────
+#
+# BOOST_RULES_PATH (JSON) has three tables:
+#
+#   features     name → {"field": ..., "contains": [...] | "regex": "..." | "equals": ...}
+#                evaluated once per chunk at index build time; the result is a
+#                bitmask per chunk id, stored as features.npz in the version dir
+#   query_flags  name → [substrings]; a flag is set when the lowercased query
+#                contains any of them
+#   rules        [{"query": flag, "chunk": [feature, ...], "boost": n}, ...]
+#                a candidate gets `boost` when the query flag is set and the
+#                chunk has all listed features
+#
+# Per query: the query flags pick the active rules, then every candidate costs
+# one mask lookup plus an AND per active rule. The file is re-read when it
+# changes (checked every BOOST_RULES_CHECK_SECONDS); editing only query_flags
+# or rules takes effect immediately, editing features recomputes the masks.
+
+BOOST_RULES_PATH = os.getenv("BOOST_RULES_PATH", os.path.join(os.path.dirname(__file__), "boost_rules.json"))
+BOOST_RULES_CHECK_SECONDS = float(os.getenv("BOOST_RULES_CHECK_SECONDS", "2"))
+
+FEATURES_FILE = "features.npz"
+
+_MAX_FEATURES = 63  # bits of an int64 mask
+
+
+class BoostTable:
+    """Compiled feature definitions, query flags and boost rules."""
+
+    def __init__(self, spec: dict):
+        features = spec.get("features", {})
+        if len(features) > _MAX_FEATURES:
+            raise ValueError(f"At most {_MAX_FEATURES} features are supported, got {len(features)}")
+        self.names = list(features)
+        self.bits = {name: 1 << i for i, name in enumerate(self.names)}
+        self.signature = hashlib.sha256(
+            json.dumps(features, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+        self._tests = [(self.bits[name], _compile_feature(name, f)) for name, f in features.items()]
+
+        self._flags = {
+            name: re.compile("|".join(re.escape(k.lower()) for k in keywords))
+            for name, keywords in spec.get("query_flags", {}).items() if keywords
+        }
+        self.rules = []
+        for rule in spec.get("rules", []):
+            unknown = [f for f in rule["chunk"] if f not in self.bits]
+            if unknown or rule["query"] not in self._flags:
+                raise ValueError(f"Boost rule {rule} refers to unknown feature(s) {unknown} or query flag")
+            mask = 0
+            for f in rule["chunk"]:
+                mask |= self.bits[f]
+            self.rules.append((rule["query"], mask, float(rule["boost"])))
+
+    def chunk_mask(self, fields: dict) -> int:
+        """Feature bitmask of one chunk, given its (lowercased) fields."""
+        mask = 0
+        for bit, test in self._tests:
+            if test(fields):
+                mask |= bit
+        return mask
+
+    def active_rules(self, query: str) -> list:
+        """[(feature mask, boost), ...] of the rules whose query flag is set for `query`."""
+        q = (query or "").lower()
+        flags = {name for name, pattern in self._flags.items() if pattern.search(q)}
+        return [(mask, boost) for flag, mask, boost in self.rules if flag in flags]
+
+
+def _compile_feature(name: str, spec: dict):
+    field = spec["field"]
+    if "contains" in spec:
+        pattern = re.compile("|".join(re.escape(k.lower()) for k in spec["contains"]))
+        return lambda fields: bool(pattern.search(fields.get(field) or ""))
+    if "regex" in spec:
+        pattern = re.compile(spec["regex"])
+        return lambda fields: bool(pattern.search(fields.get(field) or ""))
+    if "equals" in spec:
+        value = spec["equals"]
+        return lambda fields: fields.get(field) == value
+    raise ValueError(f"Feature {name!r} needs one of contains / regex / equals")
+
+
+# ─────────────────────────────────────────────
+# Rules file (re-read on change)
+# ─────────────────────────────────────────────
+
+_table = None
+_table_mtime = None
+_last_check = 0.0
+_table_lock = threading.Lock()
+
+
+def boost_table() -> BoostTable:
+    """The compiled rules of BOOST_RULES_PATH; a broken edit keeps the previous table."""
+    global _table, _table_mtime, _last_check
+    now = time.monotonic()
+    if _table is not None and now - _last_check < BOOST_RULES_CHECK_SECONDS:
+        return _table
+    with _table_lock:
+        _last_check = now
+        try:
+            mtime = os.path.getmtime(BOOST_RULES_PATH)
+        except OSError:
+            mtime = None
+        if _table is not None and mtime == _table_mtime:
+            return _table
+        try:
+            with open(BOOST_RULES_PATH, "r", encoding="utf-8") as f:
+                table = BoostTable(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+            if _table is None:
+                print(f"⚠️  Could not load boost rules from {BOOST_RULES_PATH}: {e} — no boosts applied")
+                _table = BoostTable({})
+            else:
+                print(f"⚠️  Could not reload boost rules from {BOOST_RULES_PATH}: {e} — keeping the previous rules")
+            _table_mtime = mtime
+            return _table
+        if _table is not None:
+            print(f"🔁 Boost rules reloaded from {BOOST_RULES_PATH} ({len(table.rules)} rules)")
+        _table, _table_mtime = table, mtime
+        return _table
+
+
+# ─────────────────────────────────────────────
+# Per-version feature masks (.npz, no pickle)
+# ─────────────────────────────────────────────
+
+def save_feature_masks(path: str, ids: list, masks: np.ndarray, table: BoostTable):
+    tmp = path + ".tmp.npz"
+    np.savez(
+        tmp,
+        signature=np.array(table.signature),
+        names=np.array(table.names, dtype=str),
+        ids=np.array(ids, dtype=str),
+        masks=np.asarray(masks, dtype=np.int64),
+    )
+    os.replace(tmp, path)
+
+
+def load_feature_masks(path: str, table: BoostTable):
+    """{chunk id: mask} stored at `path`, or None if missing or computed for other feature definitions."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as npz:
+        if str(npz["signature"]) != table.signature:
+            return None
+        return dict(zip(npz["ids"].tolist(), npz["masks"].tolist()))
@@ -0,0 +1,147 @@
+"""
+Compare an ONNX backend against the PyTorch models on our own corpus.
+
+    python -m embedding.check_backend --backend onnx-int8 --sample 300
+
+Reports embedding cosine agreement, nearest-neighbour overlap, CrossEncoder
+score correlation / top-1 agreement and the speed-up of both models.
+Exits non-zero when the backend falls below the accuracy thresholds.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+from scipy.stats import spearmanr
+from sentence_transformers import CrossEncoder, SentenceTransformer
+
+from embedding.backends import BACKENDS, resolve_model
+from embedding.embedding import EMBEDDING_MODEL_NAME, RERANKER_MODEL_NAME, _truncate_for_rerank
+from web_data.web_data import get_all_text_with_metadata
+
+QUERIES = [
+    "Was sind die Öffnungszeiten?",
+    "What are the opening hours?",
+    "Wie viel kostet ein functioTraining Abo?",
+    "How much does a functioTraining subscription cost?",
+    "Welche Therapien bietet functiomed an?",
+    "Which therapies does functiomed offer?",
+    "Wie melde ich einen Unfall?",
+    "How do I report an accident?",
+    "Was ist Stosswellentherapie?",
+    "What is shock wave therapy?",
+    "Übernimmt die Krankenkasse die Kosten?",
+    "Is the treatment covered by health insurance?",
+    "Wie kann ich einen Termin buchen?",
+    "How can I book an appointment?",
+    "Was muss ich zur ersten Behandlung mitbringen?",
+    "Where is the practice located?",
+]
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def _sample_chunks(n: int) -> list:
+    chunks = [c.page_content for c in get_all_text_with_metadata()]
+    if len(chunks) <= n:
+        return chunks
+    picks = np.linspace(0, len(chunks) - 1, n).astype(int)   # deterministic spread over the corpus
+    return [chunks[i] for i in picks]
+
+
+def check_embeddings(backend: str, texts: list, k: int) -> dict:
+    reference = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    path, kwargs = resolve_model(SentenceTransformer, EMBEDDING_MODEL_NAME, backend)
+    candidate = SentenceTransformer(path, device="cpu", **kwargs)
+
+    ref_docs, t_ref = _timed(lambda: reference.encode(texts, normalize_embeddings=True))
+    cand_docs, t_cand = _timed(lambda: candidate.encode(texts, normalize_embeddings=True))
+    cosines = np.sum(ref_docs * cand_docs, axis=1)
+
+    ref_q = reference.encode(QUERIES, normalize_embeddings=True)
+    cand_q = candidate.encode(QUERIES, normalize_embeddings=True)
+    ref_top = np.argsort(-(ref_q @ ref_docs.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_q @ cand_docs.T), axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]
+
+    return {
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        f"overlap@{k}": float(np.mean(overlap)),
+        "speedup": t_ref / t_cand if t_cand else float("inf"),
+        "_ref_top": ref_top,
+    }
+
+
+def check_reranker(backend: str, texts: list, ref_top: np.ndarray) -> dict:
+    reference = CrossEncoder(RERANKER_MODEL_NAME, device="cpu")
+    path, kwargs = resolve_model(CrossEncoder, RERANKER_MODEL_NAME, backend)
+    candidate = CrossEncoder(path, device="cpu", **kwargs)
+
+    # Same document truncation as serving, so both models score production inputs
+    pairs = [
+        [(q, _truncate_for_rerank(texts[i])) for i in row]
+        for q, row in zip(QUERIES, ref_top)
+    ]
+    flat = [p for group in pairs for p in group]
+    ref_scores, t_ref = _timed(lambda: np.asarray(reference.predict(flat, batch_size=8)))
+    cand_scores, t_cand = _timed(lambda: np.asarray(candidate.predict(flat, batch_size=8)))
+
+    k = ref_top.shape[1]
+    ref_scores = ref_scores.reshape(-1, k)
+    cand_scores = cand_scores.reshape(-1, k)
+    rhos = [spearmanr(a, b).correlation for a, b in zip(ref_scores, cand_scores)]
+    top1 = np.mean(np.argmax(ref_scores, axis=1) == np.argmax(cand_scores, axis=1))
+
+    return {
+        "spearman_mean": float(np.nanmean(rhos)),
+        "top1_agreement": float(top1),
+        "max_abs_diff": float(np.max(np.abs(ref_scores - cand_scores))),
+        "speedup": t_ref / t_cand if t_cand else float("inf"),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="onnx-int8", choices=[b for b in BACKENDS if b != "torch"])
+    parser.add_argument("--sample", type=int, default=300, help="number of corpus chunks to compare on")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per query")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--min-overlap", type=float, default=0.8)
+    parser.add_argument("--min-spearman", type=float, default=0.9)
+    parser.add_argument("--skip-reranker", action="store_true")
+    args = parser.parse_args(argv)
+
+    print("\n" + "=" * 70)
+    print(f"🔬 BACKEND ACCURACY CHECK — torch vs {args.backend}")
+    print("=" * 70)
+
+    texts = _sample_chunks(args.sample)
+    k = min(args.k, len(texts))
+    print(f"\n📚 {len(texts):,} corpus chunks, {len(QUERIES)} queries")
+
+    emb = check_embeddings(args.backend, texts, k)
+    ref_top = emb.pop("_ref_top")
+    print("\n🔹 Embedding model")
+    for name, value in emb.items():
+        print(f"    {name:<16}: {value:.4f}")
+    ok = emb["cosine_min"] >= args.min_cosine and emb[f"overlap@{k}"] >= args.min_overlap
+
+    if not args.skip_reranker:
+        rr = check_reranker(args.backend, texts, ref_top)
+        print("\n🔹 CrossEncoder reranker")
+        for name, value in rr.items():
+            print(f"    {name:<16}: {value:.4f}")
+        ok = ok and rr["spearman_mean"] >= args.min_spearman
+
+    print("\n" + ("✅ Backend within accuracy thresholds" if ok else "❌ Backend below accuracy thresholds"))
+    print("=" * 70 + "\n")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+# ─────────────────────────────────────────────
+# Near-duplicate detection (MinHash + LSH banding)
+# ─────────────────────────────────────────────
+#
+# Chunks are shingled into word 3-grams, hashed with NUM_PERM universal hash
+# functions and bucketed by BANDS x ROWS bands. Candidates that share a bucket
+# are confirmed by their estimated Jaccard similarity (fraction of equal
+# signature slots).
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+# Estimated Jaccard similarity at which two chunks count as the same content
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.85"))
+
+_MASK = np.uint64(0xFFFFFFFF)
+_rng = np.random.default_rng(1234567)   # fixed seed → stable signatures across runs
+_A = (_rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64) | np.uint64(1))
+_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _shingles(text: str) -> np.ndarray:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) >= SHINGLE_SIZE:
+        grams = (" ".join(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+    else:
+        grams = iter([" ".join(words)] if words else [])
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64))
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """(len(texts), NUM_PERM) uint64 MinHash signatures; empty texts get all-max rows."""
+    sigs = np.full((len(texts), NUM_PERM), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i, text in enumerate(texts):
+        shingles = _shingles(text or "")
+        if shingles.size:
+            hashed = (_A[:, None] * shingles[None, :] + _B[:, None]) & _MASK
+            sigs[i] = hashed.min(axis=1)
+    return sigs
+
+
+def near_duplicate_map(texts: List[str], n_existing: int = 0, threshold: float = NEAR_DUP_THRESHOLD) -> Dict[int, int]:
+    """
+    Map each text at index >= n_existing that near-duplicates an earlier kept
+    text to that text's index ({duplicate index: canonical index}).
+
+    The first n_existing texts (already indexed chunks) are always kept.
+    Greedy "first occurrence wins" — no transitive chaining.
+    """
+    if not texts:
+        return {}
+
+    sigs = minhash_signatures(texts)
+    empty = (sigs == np.iinfo(np.uint64).max).all(axis=1)
+    buckets = defaultdict(list)
+    mapping: Dict[int, int] = {}
+
+    for i in range(len(texts)):
+        if empty[i]:
+            continue
+        keys = [(b, sigs[i, b * ROWS : (b + 1) * ROWS].tobytes()) for b in range(BANDS)]
+
+        if i >= n_existing:
+            candidates = {j for key in keys for j in buckets.get(key, ())}
+            if candidates:
+                cand = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+                sims = (sigs[cand] == sigs[i]).mean(axis=1)
+                best = int(np.argmax(sims))
+                if sims[best] >= threshold:
+                    mapping[i] = int(cand[best])
+                    continue
+
+        for key in keys:
+            buckets[key].append(i)
+
+    return mapping
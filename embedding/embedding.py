@@ -1,17 +1,82 @@
-from web_data.web_data import get_all_text_with_metadata
+from web_data.web_data import (
+    CLEAN_DIR,
+    PDF_FILE_PREFIX,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    get_all_text_with_metadata,
+)
 from langchain_huggingface.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
-from sentence_transformers import CrossEncoder
+from langchain_core.documents import Document
+from embedding.backends import EMBEDDING_BACKEND, RERANKER_BACKEND, resolve_model
+from embedding.bm25 import BM25PlusIndex
+from embedding.embedding_store import EmbeddingStore
+from embedding.index_store import has_index, is_legacy_index, load_index, read_index_params, save_index
+from embedding.ann import build_index, configured_params
+from embedding.dedup import NEAR_DUP_THRESHOLD, near_duplicate_map
+from embedding.fusion import FUSION_METHOD, fuse
+from embedding.boost_rules import FEATURES_FILE, boost_table, load_feature_masks, save_feature_masks
+from embedding.microbatch import QUERY_MICROBATCH_MAX, RERANK_MICROBATCH_MAX, MicroBatcher
+from embedding.query_cache import LRUCache, DiskEmbeddingCache
+from sentence_transformers import CrossEncoder, SentenceTransformer
 import os
 import shutil
 import re
+import json
+import hashlib
+import time
+import fcntl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
 
 # ─────────────────────────────────────────────
 # Config
 # ─────────────────────────────────────────────
 VECTOR_DB_PATH = "data/faiss_index"
 
+EMBEDDING_MODEL_NAME = "paraphrase-multilingual-mpnet-base-v2"
+RERANKER_MODEL_NAME = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+# Cache key for query embeddings: vectors differ (slightly) between backends
+EMBEDDING_MODEL_KEY = (
+    EMBEDDING_MODEL_NAME if EMBEDDING_BACKEND == "torch"
+    else f"{EMBEDDING_MODEL_NAME}@{EMBEDDING_BACKEND}"
+)
+
+# Every build / incremental update writes a complete new index version to
+# VECTOR_DB_PATH/versions/<version>/; the CURRENT file names the version being
+# served and is replaced atomically. Each worker process checks it at most every
+# INDEX_CHECK_SECONDS and hot-swaps to a newly published version.
+INDEX_VERSIONS_DIR = os.path.join(VECTOR_DB_PATH, "versions")
+CURRENT_POINTER = os.path.join(VECTOR_DB_PATH, "CURRENT")
+INDEX_CHECK_SECONDS = float(os.getenv("INDEX_CHECK_SECONDS", "2"))
+KEEP_INDEX_VERSIONS = int(os.getenv("KEEP_INDEX_VERSIONS", "3"))
+
+# Per-file content hashes + docstore ids of the chunks in the FAISS index
+MANIFEST_FILE = "manifest.json"
+
+# BM25 term statistics + chunk ids, versioned with the manifest fingerprint
+BM25_FILE = "bm25.npz"
+
+# Collapse near-identical chunks (DE/EN twins, "Copy of" PDFs, repeated page
+# boilerplate) into one canonical chunk at index time; see embedding/dedup.py
+NEAR_DEDUP_ENABLED = os.environ.get("NEAR_DEDUP_ENABLED", "1").strip().lower() in ("1", "true", "yes")
+
+# Index-build embedding stage: chunks are sorted by length and encoded in
+# batches of EMBED_BATCH_SIZE. EMBED_WORKERS > 1 spreads encoding over a
+# sentence-transformers multi-process pool (one CPU process per worker).
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+
+# Chunk vectors keyed by hash(model, chunk text), kept across rebuilds so only
+# new/edited chunks are encoded. Lives outside VECTOR_DB_PATH (which a force
+# rebuild deletes). Set EMBEDDING_STORE_DIR="" to disable.
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "data/embedding_cache")
+
 # Increased threshold to filter out more irrelevant content
 RELEVANCE_THRESHOLD = -2.5  # More strict than -3.5
 
@@ -20,27 +85,84 @@ CANDIDATE_MULTIPLIER = 4
 
 # CrossEncoder has ~512 token limit; truncate doc text to avoid overflow/OOM
 RERANKER_DOC_MAX_CHARS = 450
-RERANKER_BATCH_SIZE = 8
 
-# Set RERANKER_ENABLED=1 in env to enable CrossEncoder reranking (can cause OOM/timeout on some machines)
+# Cascade reranking: the fused hybrid order is the (free) first stage and the
+# CrossEncoder only scores its top RERANK_TOP_M candidates, best first. Batches
+# grow up to RERANKER_BATCH_SIZE pairs as long as the padded batch stays within
+# RERANKER_BATCH_TOKENS, and no new batch is started once it would overrun
+# RERANK_BUDGET_MS; candidates left unscored keep their fused order behind the
+# reranked ones. Scores are cached per (index version, normalized query, chunk id).
+RERANK_TOP_M = int(os.getenv("RERANK_TOP_M", "30"))
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "32"))
+RERANKER_BATCH_TOKENS = int(os.getenv("RERANKER_BATCH_TOKENS", "4096"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "1500"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+# Set RERANKER_ENABLED=1 in env to enable CrossEncoder reranking (can cause OOM/timeout on some machines
+# with the PyTorch backend — RERANKER_BACKEND=onnx-int8 is much lighter, see embedding/backends.py)
 RERANKER_ENABLED = os.environ.get("RERANKER_ENABLED", "").strip().lower() in ("1", "true", "yes")
 
+# STEP 1 (query encoding + FAISS) and STEP 2 (BM25) of retrieve() are
+# independent: BM25 runs on a small side pool of PARALLEL_RETRIEVERS threads
+# while the request thread encodes the query and searches FAISS (both release
+# the GIL). 0 → run them one after the other.
+PARALLEL_RETRIEVERS = int(os.getenv("PARALLEL_RETRIEVERS", "4"))
+
+# Query-path caches: normalized query → embedding (LRU, optionally persisted to
+# SQLite at QUERY_CACHE_PATH) and (query, top_n, intent) → ranked chunk ids
+# (with their retrieval scores).
+# The result cache is dropped whenever a different index version is activated
+# (the content fingerprint is not enough: with near-duplicate collapse, which
+# chunk ids exist depends on the update history, not only on the files).
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_PATH = os.environ.get("QUERY_CACHE_PATH", "").strip()
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "1024"))
+
 # ─────────────────────────────────────────────
 # In-memory caches to avoid reloading heavy models/indexes every query
 # ─────────────────────────────────────────────
 _embedding_model = None
 _vector_store_cache = None
-_all_chunks_cache = None
-_web_chunks_cache = None
-_pdf_chunks_cache = None
+_source_counts_cache = None
 _bm25_cache = None
+_chunk_features_cache = None
 _reranker_cache = None
+_served_version = None
+_query_embedding_cache = LRUCache(QUERY_CACHE_SIZE)
+_disk_query_cache = None
+_result_cache = LRUCache(RESULT_CACHE_SIZE)
+_rerank_score_cache = LRUCache(RERANK_CACHE_SIZE)
+_retriever_pool = None
+_embedding_store = None
+_loaded_version = None
+_last_version_check = 0.0
+_swap_lock = threading.Lock()
+_write_lock = threading.RLock()
+_write_lock_depth = 0
 
 
 # ─────────────────────────────────────────────
 # Query Classification
 # ─────────────────────────────────────────────
 
+# Informational query indicators
+_INFO_KEYWORDS = (
+    'how', 'what', 'when', 'where', 'can i', 'wie kann',
+    'book', 'appointment', 'termin', 'buchen', 'contact',
+    'phone', 'email', 'opening hours', 'services', 'treatment',
+    'cost', 'price', 'insurance', 'process', 'procedure',
+    'öffnungszeiten', 'kontakt', 'telefon', 'angebot'
+)
+
+# Form-related query indicators
+_FORM_KEYWORDS = (
+    'registration', 'anmeldung', 'form', 'formular',
+    'documents needed', 'what information', 'fill out',
+    'patient form', 'which documents', 'bring to appointment'
+)
+
+
+@lru_cache(maxsize=4096)
 def classify_query_intent(query: str) -> str:
     """
     Detect if query is asking for:
@@ -49,27 +171,12 @@ def classify_query_intent(query: str) -> str:
     - 'general' (unclear/mixed)
     
     Returns: 'information', 'form', or 'general'
+    (memoized — the same questions come in over and over)
     """
     q_lower = query.lower()
     
-    # Informational query indicators
-    info_keywords = [
-        'how', 'what', 'when', 'where', 'can i', 'wie kann', 
-        'book', 'appointment', 'termin', 'buchen', 'contact',
-        'phone', 'email', 'opening hours', 'services', 'treatment',
-        'cost', 'price', 'insurance', 'process', 'procedure',
-        'öffnungszeiten', 'kontakt', 'telefon', 'angebot'
-    ]
-    
-    # Form-related query indicators
-    form_keywords = [
-        'registration', 'anmeldung', 'form', 'formular',
-        'documents needed', 'what information', 'fill out',
-        'patient form', 'which documents', 'bring to appointment'
-    ]
-    
-    info_count = sum(1 for kw in info_keywords if kw in q_lower)
-    form_count = sum(1 for kw in form_keywords if kw in q_lower)
+    info_count = sum(1 for kw in _INFO_KEYWORDS if kw in q_lower)
+    form_count = sum(1 for kw in _FORM_KEYWORDS if kw in q_lower)
     
     if info_count > form_count:
         return 'information'
@@ -79,6 +186,17 @@ def classify_query_intent(query: str) -> str:
         return 'general'
 
 
+_GERMAN_MARKERS = re.compile(
+    r"[äöüß]|\b(der|die|das|und|ist|ich|wie|wann|wo|kann|ein|eine|mit|für|bei|"
+    r"haben|sie|termin|öffnungszeiten|oeffnungszeiten)\b"
+)
+
+
+def detect_language(text: str) -> str:
+    """Rough German/English detection: 'de' or 'en'."""
+    return "de" if _GERMAN_MARKERS.search((text or "").lower()) else "en"
+
+
 # ─────────────────────────────────────────────
 # Helpers
 # ─────────────────────────────────────────────
@@ -95,129 +213,865 @@ def normalize_query(query: str) -> str:
     return q.strip()
 
 
-def load_all_chunks():
+def _reset_chunk_caches():
+    """Drop the per-corpus source counts + BM25 so they are rebuilt from the new corpus."""
+    global _bm25_cache, _source_counts_cache
+    _source_counts_cache = None
+    _bm25_cache = None
+
+
+# ─────────────────────────────────────────────
+# Corpus manifest (incremental indexing)
+# ─────────────────────────────────────────────
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_clean_text() -> dict:
+    """Return {filename: sha256} for every .txt file in data/clean_text/."""
+    if not os.path.isdir(CLEAN_DIR):
+        return {}
+    return {
+        f: _hash_file(os.path.join(CLEAN_DIR, f))
+        for f in sorted(os.listdir(CLEAN_DIR))
+        if f.endswith(".txt")
+    }
+
+
+def _near_dup_setting():
+    """Near-duplicate threshold the index is built with (None when collapsing is disabled)."""
+    return NEAR_DUP_THRESHOLD if NEAR_DEDUP_ENABLED else None
+
+
+def corpus_fingerprint(file_hashes: dict) -> str:
+    """Hash of all file hashes + chunking/dedup params; changes whenever the index content does."""
+    h = hashlib.sha256(f"{CHUNK_SIZE}:{CHUNK_OVERLAP}:{_near_dup_setting()}".encode())
+    for name in sorted(file_hashes):
+        h.update(f"\n{name}\0{file_hashes[name]}".encode())
+    return h.hexdigest()[:16]
+
+
+def load_manifest(version=None):
+    """Load the manifest of `version` (default: the published one), or None if missing/unreadable."""
+    version = version or current_version()
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(_version_dir(version), MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(files: dict, path: str):
     """
-    Load all chunks from data/clean_text/ (web + PDF).
-    Cached in-memory so we only hit disk + splitter once.
+    Write the manifest for the index version being saved at `path`.
+
+    `files` is {filename: {"sha256": ..., "ids": [docstore ids],
+    "merged_into": [ids of canonical chunks in other files]}}.
     """
-    global _all_chunks_cache, _web_chunks_cache, _pdf_chunks_cache
+    manifest = {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "near_dup_threshold": _near_dup_setting(),
+        "embedding_model": EMBEDDING_MODEL_KEY,
+        "fingerprint": corpus_fingerprint({k: v["sha256"] for k, v in files.items()}),
+        "files": files,
+    }
+    tmp = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(path, MANIFEST_FILE))
+    return manifest
 
-    if _all_chunks_cache is not None:
-        return _all_chunks_cache, _web_chunks_cache, _pdf_chunks_cache
 
-    print("\n" + "=" * 70)
-    print("📚 LOADING ALL DOCUMENT CHUNKS  (web + pdf from clean_text/)")
-    print("=" * 70)
+# ─────────────────────────────────────────────
+# Index versions (shared by all worker processes)
+# ─────────────────────────────────────────────
 
-    all_chunks = get_all_text_with_metadata()
+def current_version():
+    """Name of the published index version, or None if nothing was published yet."""
+    try:
+        with open(CURRENT_POINTER, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _version_dir(version: str) -> str:
+    return os.path.join(INDEX_VERSIONS_DIR, version)
+
+
+def _new_version_dir() -> tuple:
+    """Create an empty directory for a new index version; returns (version, path)."""
+    ns = time.time_ns()
+    version = time.strftime("%Y%m%dT%H%M%S", time.gmtime(ns // 10**9)) + f"-{ns % 10**9:09d}"
+    path = _version_dir(version)
+    os.makedirs(path)
+    return version, path
+
+
+def _publish_version(version: str):
+    """Atomically point CURRENT at `version`, then drop old versions."""
+    tmp = CURRENT_POINTER + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(tmp, CURRENT_POINTER)
+    print(f"    📌 Published index version {version}")
+
+    # Keep a few old versions: other workers may still be serving them
+    versions = sorted(os.listdir(INDEX_VERSIONS_DIR))
+    for old in versions[:-KEEP_INDEX_VERSIONS]:
+        if old != version:
+            shutil.rmtree(_version_dir(old), ignore_errors=True)
+
+    # Files of the unversioned layout (index directly in VECTOR_DB_PATH)
+    for name in ("index.faiss", "index.pkl", "docstore.bin", "docstore.npz", MANIFEST_FILE, BM25_FILE):
+        legacy = os.path.join(VECTOR_DB_PATH, name)
+        if os.path.exists(legacy):
+            os.remove(legacy)
+
+
+@contextmanager
+def _index_write_lock():
+    """Serialize index builds/updates across threads and worker processes (flock)."""
+    global _write_lock_depth
+    with _write_lock:
+        if _write_lock_depth == 0:
+            os.makedirs(VECTOR_DB_PATH, exist_ok=True)
+            lock_file = open(os.path.join(VECTOR_DB_PATH, ".lock"), "w")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _write_lock_depth += 1
+        try:
+            yield
+        finally:
+            _write_lock_depth -= 1
+            if _write_lock_depth == 0:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
 
-    web_chunks = [c for c in all_chunks if c.metadata.get("source_type") == "web"]
-    pdf_chunks = [c for c in all_chunks if c.metadata.get("source_type") == "pdf"]
 
-    print(f"\n📊 SUMMARY:")
-    print(f"    • Web chunks : {len(web_chunks):,}")
-    print(f"    • PDF chunks : {len(pdf_chunks):,}")
-    print(f"    • TOTAL      : {len(all_chunks):,}")
-    print("=" * 70 + "\n")
+def index_write_lock():
+    """
+    The index write lock, for other writers of index inputs (e.g. PDF
+    conversion into clean_text/ and its hash manifest).
+    """
+    return _index_write_lock()
+
+
+def _activate_version(version: str):
+    """Load a published index version (mmap'ed) and make it the one this process serves."""
+    global _vector_store_cache, _bm25_cache, _chunk_features_cache, _loaded_version
+    path = _version_dir(version)
+    store = load_index(path, get_embedding_model())
+    manifest = load_manifest(version)
+    fingerprint = manifest["fingerprint"] if manifest else None
+
+    bm25 = _load_bm25_snapshot(fingerprint, path)
+    if bm25 is None:
+        bm25 = _build_bm25(_chunks_from_store(store), _store_ids(store), fingerprint, path)
+    features = _load_features_snapshot(path)
+    if features is None:
+        features = _build_features(_chunks_from_store(store), _store_ids(store), path)
+
+    if manifest and manifest.get("embedding_model", EMBEDDING_MODEL_NAME) != EMBEDDING_MODEL_KEY:
+        print(f"    ⚠️  Index was embedded with {manifest.get('embedding_model', EMBEDDING_MODEL_NAME)}, "
+              f"queries use {EMBEDDING_MODEL_KEY} — run /ingest to rebuild")
+
+    with _swap_lock:
+        _reset_chunk_caches()
+        _vector_store_cache = store
+        _bm25_cache = bm25
+        _chunk_features_cache = features
+        _loaded_version = version
+        _set_served_version(version)
+    return store
+
+
+def _refresh_if_republished():
+    """Hot-swap to a version published by another worker (checked every INDEX_CHECK_SECONDS)."""
+    global _last_version_check
+    now = time.monotonic()
+    if now - _last_version_check < INDEX_CHECK_SECONDS:
+        return
+    _last_version_check = now
+
+    version = current_version()
+    if version is None or version == _loaded_version or not has_index(_version_dir(version)):
+        return
+    print(f"\n🔁 Index version {version} was published — hot-swapping (was {_loaded_version})")
+    try:
+        _activate_version(version)
+    except Exception as e:
+        print(f"    ⚠️  Could not load index version {version}: {e}")
 
-    _all_chunks_cache = all_chunks
-    _web_chunks_cache = web_chunks
-    _pdf_chunks_cache = pdf_chunks
 
-    return all_chunks, web_chunks, pdf_chunks
+def _serving_index() -> tuple:
+    """
+    (vector store, BM25, version name, chunk features) of the served index
+    version, read together so a concurrent hot-swap can't mix two versions
+    in one query.
+    """
+    build_or_load_vectorstore()
+    with _swap_lock:
+        return _vector_store_cache, _bm25_cache, _served_version, _chunk_features_cache
 
 
-def build_or_load_vectorstore(force_rebuild: bool = False):
+def preload_models():
     """
-    Build a new FAISS index or load an existing one.
-    Uses in-memory cache so we don't reload the model/index on every query.
+    Load model weights in the current process. Called before workers are
+    forked (gunicorn preload_app) so they share the weights copy-on-write.
     """
-    global _embedding_model, _vector_store_cache
+    get_embedding_model()
+    if RERANKER_ENABLED:
+        load_reranker()
 
-    print("\n" + "=" * 70)
-    print("🔧 VECTOR STORE INITIALIZATION")
-    print("=" * 70)
 
-    # Lazy-load embedding model once
+def _manifest_files_for(chunks: list, file_hashes: dict, merged: dict) -> dict:
+    """
+    Group chunk ids by their clean_text file.
+
+    Chunks collapsed into a canonical chunk (`merged`: duplicate id → canonical
+    id) are not in the index; their file records the canonical id instead.
+    """
+    files = {name: {"sha256": digest, "ids": [], "merged_into": []} for name, digest in file_hashes.items()}
+    for c in chunks:
+        filename = c.metadata["page_name"] + ".txt"
+        if filename not in files:
+            continue
+        cid = c.metadata["chunk_id"]
+        if cid in merged:
+            files[filename]["merged_into"].append(merged[cid])
+        else:
+            files[filename]["ids"].append(cid)
+    return files
+
+
+def _collapse_near_duplicates(chunks: list, existing: list = ()) -> tuple:
+    """
+    Drop chunks that near-duplicate an earlier chunk or an already indexed one
+    (`existing`). The dropped chunk's page is recorded on the canonical chunk
+    under metadata["duplicate_pages"].
+
+    Returns (kept chunks, {duplicate chunk_id: canonical chunk_id}).
+    """
+    if not NEAR_DEDUP_ENABLED or not chunks:
+        return list(chunks), {}
+
+    pool = list(existing) + list(chunks)
+    mapping = near_duplicate_map([c.page_content for c in pool], n_existing=len(existing))
+
+    merged = {}
+    for dup, canon in mapping.items():
+        canonical, duplicate = pool[canon], pool[dup]
+        page = duplicate.metadata["page_name"]
+        pages = canonical.metadata.setdefault("duplicate_pages", [])
+        if page != canonical.metadata["page_name"] and page not in pages:
+            pages.append(page)
+        merged[duplicate.metadata["chunk_id"]] = canonical.metadata["chunk_id"]
+
+    kept = [c for i, c in enumerate(chunks, start=len(existing)) if i not in mapping]
+    if merged:
+        print(f"    🧬 Collapsed {len(merged):,} near-duplicate chunks ({len(kept):,} of {len(chunks):,} kept)")
+    return kept, merged
+
+
+def _set_served_version(version):
+    """Remember which index version is being served; ranked results of other versions are dropped."""
+    global _served_version
+    if version != _served_version:
+        _result_cache.clear()
+        _rerank_score_cache.clear()
+    _served_version = version
+
+
+def get_index_version():
+    """Name of the index version currently being served (keys the query-path caches)."""
+    return _served_version
+
+
+def get_embedding_model():
+    """Lazy-load the sentence embedding model once."""
+    global _embedding_model
     if _embedding_model is None:
-        print("\n📦 Loading embedding model: paraphrase-multilingual-mpnet-base-v2 ...")
+        print(f"\n📦 Loading embedding model: {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND}) ...")
+        model_path, backend_kwargs = resolve_model(SentenceTransformer, EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
         _embedding_model = HuggingFaceEmbeddings(
-            model_name="paraphrase-multilingual-mpnet-base-v2",
-            model_kwargs={"device": "cpu"},
+            model_name=model_path,
+            model_kwargs={"device": "cpu", **backend_kwargs},
             encode_kwargs={"normalize_embeddings": True},
         )
         print("    ✅ Embedding model loaded")
+    return _embedding_model
+
+
+def embed_query(query: str) -> list:
+    """
+    Embed a query, skipping transformer inference for repeated questions.
+
+    Keyed by the normalized query, so "Öffnungszeiten" and " öffnungszeiten "
+    share one entry; the transformer itself always sees the query as sent.
+    Looks in the in-memory LRU first, then the optional on-disk cache
+    (QUERY_CACHE_PATH).
+    """
+    global _disk_query_cache
+    key = normalize_query(query)
+    vector = _query_embedding_cache.get(key)
+    if vector is not None:
+        return vector
+
+    if QUERY_CACHE_PATH and _disk_query_cache is None:
+        _disk_query_cache = DiskEmbeddingCache(QUERY_CACHE_PATH)
+    if _disk_query_cache is not None:
+        vector = _disk_query_cache.get(EMBEDDING_MODEL_KEY, key)
+
+    if vector is None:
+        # Encoded together with the queries of concurrent requests (embedding/microbatch.py)
+        vector = _query_batcher.submit([query])[0]
+        if _disk_query_cache is not None:
+            _disk_query_cache.put(EMBEDDING_MODEL_KEY, key, vector)
+
+    _query_embedding_cache.put(key, vector)
+    return vector
+
+
+def _encode_queries(texts: list) -> list:
+    """One forward pass over the queries of one or more requests."""
+    return get_embedding_model().embed_documents(texts)
+
+
+_query_batcher = MicroBatcher("query", _encode_queries, QUERY_MICROBATCH_MAX)
+
+
+# ─────────────────────────────────────────────
+# Document embedding stage (index builds)
+# ─────────────────────────────────────────────
+
+def embed_documents(texts: list) -> np.ndarray:
+    """
+    Encode chunk texts for the index; returns (len(texts), dim) float32 unit vectors.
+
+    Vectors already in the embedding store (EMBEDDING_STORE_DIR) are reused;
+    the rest are sorted by length so every batch pads to a similar size, then
+    encoded in EMBED_BATCH_SIZE batches — across an EMBED_WORKERS process
+    pool when EMBED_WORKERS > 1. Prints progress and chunks/s.
+    """
+    global _embedding_store
+    model = get_embedding_model()
+    client = getattr(model, "_client", None)   # underlying SentenceTransformer
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    # Same preprocessing HuggingFaceEmbeddings applies, so vectors match embed_query
+    prepared = [t.replace("\n", " ") for t in texts]
+    vectors = [None] * len(prepared)
+
+    if EMBEDDING_STORE_DIR and _embedding_store is None:
+        _embedding_store = EmbeddingStore(EMBEDDING_STORE_DIR, EMBEDDING_MODEL_KEY)
+    if _embedding_store is not None:
+        found, missing = _embedding_store.get_many(prepared)
+        for i, v in found.items():
+            vectors[i] = v
+        print(f"    ♻️  Reusing {len(found):,} stored embeddings, encoding {len(missing):,}")
+    else:
+        missing = list(range(len(prepared)))
+
+    total = len(missing)
+    order = sorted(missing, key=lambda i: len(prepared[i]), reverse=True)
+    batch_size = max(1, EMBED_BATCH_SIZE)
+    workers = max(1, EMBED_WORKERS) if client is not None else 1
+
+    pool = None
+    if workers > 1:
+        print(f"    🧵 Starting {workers} encoder processes ...")
+        pool = client.start_multi_process_pool(target_devices=["cpu"] * workers)
+
+    # One progress step = one batch per worker
+    step = batch_size * workers
+    start = time.perf_counter()
+    next_report = 0.0
+    try:
+        for offset in range(0, total, step):
+            idx = order[offset : offset + step]
+            batch = [prepared[i] for i in idx]
+            if pool is not None:
+                out = client.encode_multi_process(batch, pool, batch_size=batch_size)
+            elif client is not None:
+                out = client.encode(batch, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+            else:
+                out = model.embed_documents(batch)
+            out = np.asarray(out, dtype=np.float32)
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+            for i, v in zip(idx, out):
+                vectors[i] = v
+            if _embedding_store is not None:
+                _embedding_store.put_many(batch, out)
+
+            done = min(offset + step, total)
+            if done / total >= next_report or done == total:
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed if elapsed > 0 else float("inf")
+                print(f"    ⏳ Embedded {done:,}/{total:,} chunks ({rate:,.1f} chunks/s)")
+                next_report = done / total + 0.1
+    finally:
+        if pool is not None:
+            client.stop_multi_process_pool(pool)
+
+    matrix = np.vstack(vectors)
+    if total == 0:
+        return matrix
+
+    elapsed = time.perf_counter() - start
+    print(f"    ✅ {total:,} chunks embedded in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.1f} chunks/s)")
+    return matrix
+
+
+def _text_embeddings(chunks: list) -> list:
+    """[(text, vector)] pairs for FAISS.from_embeddings / add_embeddings."""
+    vectors = embed_documents([c.page_content for c in chunks])
+    return [(c.page_content, v.tolist()) for c, v in zip(chunks, vectors)]
+
+
+def build_or_load_vectorstore(force_rebuild: bool = False):
+    """
+    Build a new FAISS index or load the published one.
+    Uses in-memory cache so we don't reload the model/index on every query,
+    and hot-swaps when another worker publishes a new index version.
+    """
+    global _vector_store_cache
+
+    print("\n" + "=" * 70)
+    print("🔧 VECTOR STORE INITIALIZATION")
+    print("=" * 70)
 
-    # On force rebuild, drop on-disk index and in-memory cache
-    if force_rebuild and os.path.exists(VECTOR_DB_PATH):
-        print(f"\n🗑️  FORCE REBUILD — deleting {VECTOR_DB_PATH}")
-        shutil.rmtree(VECTOR_DB_PATH)
-        print("    ✅ Old index deleted")
-        _vector_store_cache = None
+    # Lazy-load embedding model once
+    embedding_model = get_embedding_model()
 
     # If we already have an in-memory vector store and not forcing rebuild, reuse it
     if _vector_store_cache is not None and not force_rebuild:
+        _refresh_if_republished()
         print("\n📂 Using cached in-memory FAISS index")
         print("=" * 70 + "\n")
         return _vector_store_cache
 
     try:
-        if os.path.exists(VECTOR_DB_PATH) and not force_rebuild:
-            print(f"\n📂 Loading existing index from {VECTOR_DB_PATH} ...")
-            _vector_store_cache = FAISS.load_local(
-                VECTOR_DB_PATH,
-                _embedding_model,
-                allow_dangerous_deserialization=True,
-            )
+        version = current_version()
+        if version and has_index(_version_dir(version)) and not force_rebuild:
+            print(f"\n📂 Loading index version {version} (mmap) ...")
+            store = _activate_version(version)
             print("    ✅ Index loaded successfully!")
             print("=" * 70 + "\n")
-            return _vector_store_cache
+            return store
+        elif (has_index(VECTOR_DB_PATH) or is_legacy_index(VECTOR_DB_PATH)) and not force_rebuild:
+            # Never unpickle; chunk vectors mostly come from the embedding store
+            raise FileNotFoundError("Unversioned index found — rebuilding as a published version")
         else:
             raise FileNotFoundError("No index found or force rebuild requested")
 
     except Exception as e:
-        print(f"\n🔨 BUILDING NEW FAISS INDEX")
-        print(f"    Reason: {e}")
+        with _index_write_lock():
+            # Another worker may have published an index while we waited for the lock
+            version = current_version()
+            if not force_rebuild and version and has_index(_version_dir(version)):
+                print(f"\n📂 Index version {version} was built meanwhile — loading it")
+                return _activate_version(version)
+
+            print(f"\n🔨 BUILDING NEW FAISS INDEX")
+            print(f"    Reason: {e}")
+            return _build_new_version(embedding_model)
+
+
+def _build_new_version(embedding_model):
+    """Chunk + embed all of clean_text/ into a new index version and publish it (write lock held)."""
+    file_hashes = scan_clean_text()
+    all_docs = get_all_text_with_metadata()
+
+    if not all_docs:
+        raise ValueError("No documents found!")
+
+    unique_docs, merged = _collapse_near_duplicates(all_docs)
+
+    print(f"\n🧮 Creating embeddings for {len(unique_docs):,} chunks ...")
+    store = FAISS.from_embeddings(
+        text_embeddings=_text_embeddings(unique_docs),
+        embedding=embedding_model,
+        metadatas=[d.metadata for d in unique_docs],
+        ids=[d.metadata["chunk_id"] for d in unique_docs],
+    )
 
-        all_docs, _, _ = load_all_chunks()
+    version, path = _new_version_dir()
+    print(f"\n💾 Saving index to {path} ...")
+    try:
+        save_index(store, path, configured_params())
+        manifest = _save_manifest(_manifest_files_for(all_docs, file_hashes, merged), path)
+        _build_bm25(unique_docs, [d.metadata["chunk_id"] for d in unique_docs], manifest["fingerprint"], path)
+        _build_features(unique_docs, [d.metadata["chunk_id"] for d in unique_docs], path)
+    except Exception:
+        # Never leave a half-written version behind; CURRENT still names the old one
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    _publish_version(version)
+    store = _activate_version(version)
+    print("    ✅ Saved!")
+    print("=" * 70 + "\n")
 
-        if not all_docs:
-            raise ValueError("No documents found!")
+    return store
 
-        print(f"\n🧮 Creating embeddings for {len(all_docs):,} chunks ...")
-        _vector_store_cache = FAISS.from_documents(
-            documents=all_docs,
-            embedding=_embedding_model,
+
+def update_vectorstore() -> dict:
+    """
+    Incrementally sync the FAISS index with data/clean_text/.
+
+    Compares the content hash of every file against the manifest and only
+    re-chunks / re-embeds added or changed files. Vectors of changed or
+    deleted files are removed from the store by docstore id. Unchanged files
+    whose chunks were collapsed into a chunk of a changed/deleted file are
+    re-chunked as well, so their content does not disappear with it.
+    Falls back to a full rebuild if there is no (compatible) manifest.
+
+    The result is published as a new index version; other workers pick it
+    up on their next query.
+
+    Returns a summary of what changed.
+    """
+    with _index_write_lock():
+        return _update_published_version()
+
+
+def _update_published_version() -> dict:
+    """Body of update_vectorstore() (write lock held)."""
+    version = current_version()
+    manifest = load_manifest(version)
+    if (
+        manifest is None
+        or manifest.get("chunk_size") != CHUNK_SIZE
+        or manifest.get("chunk_overlap") != CHUNK_OVERLAP
+        or manifest.get("near_dup_threshold") != _near_dup_setting()
+        or manifest.get("embedding_model", EMBEDDING_MODEL_NAME) != EMBEDDING_MODEL_KEY
+    ):
+        print("\n⚠️  No compatible index manifest — doing a full rebuild")
+        store = build_or_load_vectorstore(force_rebuild=True)
+        return {
+            "mode": "full",
+            "total_chunks": store.index.ntotal,
+        }
+
+    # The served index is mapped read-only — apply changes to a writable copy
+    build_or_load_vectorstore()
+    store = load_index(_version_dir(version), get_embedding_model(), writable=True)
+    index_params = read_index_params(_version_dir(version))
+    params_changed = index_params["requested"] != configured_params()
+    if index_params["built"]["type"] != "flat":
+        # HNSW can't delete and IVF-PQ only keeps compressed vectors: work on an
+        # exact copy (vectors from the embedding store) and rebuild on save
+        docs = _chunks_from_store(store)
+        store.index = build_index(embed_documents([d.page_content for d in docs]), {"type": "flat"})[0]
+
+    print("\n" + "=" * 70)
+    print("🔄 INCREMENTAL INDEX UPDATE")
+    print("=" * 70)
+
+    current = scan_clean_text()
+    old_files = manifest["files"]
+
+    added = sorted(f for f in current if f not in old_files)
+    changed = sorted(
+        f for f in current
+        if f in old_files and old_files[f]["sha256"] != current[f]
+    )
+    deleted = sorted(f for f in old_files if f not in current)
+
+    # Files that were collapsed into chunks of a stale file lose their
+    # canonical copy — re-chunk them too (transitively)
+    stale = set(changed + deleted)
+    dependents = set()
+    while True:
+        stale_id_set = {i for f in stale | dependents for i in old_files[f]["ids"]}
+        more = {
+            f for f in current
+            if f in old_files and f not in stale | dependents
+            and any(i in stale_id_set for i in old_files[f].get("merged_into", []))
+        }
+        if not more:
+            break
+        dependents |= more
+    dependents = sorted(dependents)
+
+    print(f"    Added  : {len(added)}")
+    print(f"    Changed: {len(changed)}")
+    print(f"    Deleted: {len(deleted)}")
+    if dependents:
+        print(f"    Re-chunked (duplicates of stale files): {len(dependents)}")
+    if params_changed:
+        print(f"    Index type: {index_params['requested']['type']} → {configured_params()['type']}")
+
+    stale_files = changed + deleted + dependents
+    stale_ids = [i for f in stale_files for i in old_files[f]["ids"]]
+    stale_id_set = set(stale_ids)
+    reprocess = sorted(added + changed + dependents)
+
+    # Canonical chunks that survive no longer stand in for the stale files
+    for f in stale_files:
+        page = f[:-len(".txt")]
+        for cid in old_files[f].get("merged_into", []):
+            if cid in stale_id_set:
+                continue
+            doc = store.docstore.search(cid)
+            pages = getattr(doc, "metadata", {}).get("duplicate_pages")
+            if pages and page in pages:
+                pages.remove(page)
+
+    if stale_ids:
+        print(f"\n🗑️  Removing {len(stale_ids):,} stale vectors ...")
+        store.delete(stale_ids)
+
+    all_new = get_all_text_with_metadata(filenames=reprocess) if reprocess else []
+    new_chunks, merged = _collapse_near_duplicates(all_new, existing=_chunks_from_store(store)) if all_new else ([], {})
+
+    if new_chunks:
+        print(f"\n🧮 Embedding {len(new_chunks):,} new chunks ...")
+        store.add_embeddings(
+            _text_embeddings(new_chunks),
+            metadatas=[c.metadata for c in new_chunks],
+            ids=[c.metadata["chunk_id"] for c in new_chunks],
         )
 
-        print(f"\n💾 Saving index to {VECTOR_DB_PATH} ...")
-        _vector_store_cache.save_local(VECTOR_DB_PATH)
+    files = {f: old_files[f] for f in current if f in old_files and f not in stale_files}
+    files.update(_manifest_files_for(all_new, {f: current[f] for f in reprocess}, merged))
+
+    if stale_ids or new_chunks or merged or files != old_files or params_changed:
+        new_version, path = _new_version_dir()
+        print(f"\n💾 Saving index to {path} ...")
+        try:
+            save_index(store, path, configured_params())
+            manifest = _save_manifest(files, path)
+            chunks = _chunks_from_store(store)
+            _build_bm25(chunks, _store_ids(store), manifest["fingerprint"], path)
+            _build_features(chunks, _store_ids(store), path)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        _publish_version(new_version)
+        _activate_version(new_version)
         print("    ✅ Saved!")
-        print("=" * 70 + "\n")
+    else:
+        print("\n✅ Index already up to date")
+    print("=" * 70 + "\n")
 
-        return _vector_store_cache
+    return {
+        "mode": "incremental",
+        "added": added,
+        "changed": changed,
+        "deleted": deleted,
+        "rechunked_duplicates": dependents,
+        "chunks_added": len(new_chunks),
+        "chunks_merged": len(merged),
+        "chunks_removed": len(stale_ids),
+        "total_chunks": store.index.ntotal,
+    }
 
 
 def load_reranker():
     """Load CrossEncoder reranker (cached in memory). Forces CPU to avoid OOM."""
     global _reranker_cache
     if _reranker_cache is None:
-        print("\n📦 Loading CrossEncoder reranker (this may take a moment) ...")
+        print(f"\n📦 Loading CrossEncoder reranker ({RERANKER_BACKEND}, this may take a moment) ...")
+        model_path, backend_kwargs = resolve_model(CrossEncoder, RERANKER_MODEL_NAME, RERANKER_BACKEND)
         _reranker_cache = CrossEncoder(
-            "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+            model_path,
             device="cpu",
+            **backend_kwargs,
         )
         print("    ✅ Reranker loaded")
     return _reranker_cache
 
 
-def get_bm25(all_chunks):
-    """Build BM25 retriever once and reuse it."""
-    global _bm25_cache
-    if _bm25_cache is None:
-        print("\n📦 Building BM25 index (first query only) ...")
-        _bm25_cache = BM25Retriever.from_documents(all_chunks, bm25_variant="plus")
-    return _bm25_cache
+def _source_counts(store) -> tuple:
+    """(web, pdf) chunk counts of the served index, derived from the chunk ids."""
+    global _source_counts_cache
+    if _source_counts_cache is None:
+        ids = _store_ids(store)
+        n_pdf = sum(1 for i in ids if i.startswith(PDF_FILE_PREFIX))
+        _source_counts_cache = (len(ids) - n_pdf, n_pdf)
+    return _source_counts_cache
+
+
+def _store_ids(store) -> list:
+    """Docstore ids of all vectors in the FAISS index, in index order."""
+    return [store.index_to_docstore_id[i] for i in range(store.index.ntotal)]
+
+
+def _chunks_from_store(store) -> list:
+    """All chunk Documents held by the FAISS docstore, in index order."""
+    return _docs_by_id(store, _store_ids(store))
+
+
+def _docs_by_id(store, ids) -> list:
+    """Look up chunk Documents in the FAISS docstore by id (None for ids not in the index)."""
+    docs = []
+    for i in ids:
+        doc = store.docstore.search(i)
+        docs.append(doc if isinstance(doc, Document) else None)
+    return docs
+
+
+def _build_bm25(chunks: list, ids: list, fingerprint, path: str):
+    """Build BM25 over `chunks` (with docstore `ids`) and persist it into index version dir `path`."""
+    print(f"\n📦 Building BM25 index over {len(chunks):,} chunks ...")
+    bm25 = BM25PlusIndex.from_texts([c.page_content for c in chunks], ids=ids)
+    if fingerprint is not None:
+        bm25_path = os.path.join(path, BM25_FILE)
+        bm25.save(bm25_path, fingerprint)
+        print(f"    ✅ BM25 snapshot saved to {bm25_path}")
+    return bm25
+
+
+def _load_bm25_snapshot(fingerprint, path: str):
+    """Load the BM25 index persisted in version dir `path` if it matches the index fingerprint."""
+    bm25_path = os.path.join(path, BM25_FILE)
+    if fingerprint is None or not os.path.exists(bm25_path):
+        return None
+    try:
+        if BM25PlusIndex.read_fingerprint(bm25_path) != fingerprint:
+            print("    ⚠️  BM25 snapshot is stale (fingerprint mismatch)")
+            return None
+        bm25 = BM25PlusIndex.load(bm25_path)
+        print(f"    📂 BM25 index loaded from {bm25_path}")
+        return bm25
+    except Exception as e:
+        print(f"    ⚠️  Could not read BM25 snapshot: {e}")
+        return None
+
+
+def _chunk_fields(doc) -> dict:
+    """The chunk fields boost_rules.json features are defined over (lowercased)."""
+    content = (doc.page_content or "").lower()
+    return {
+        "name": (doc.metadata.get("page_name") or doc.metadata.get("source_pdf") or "").lower().strip(),
+        "content": content,
+        "source_type": doc.metadata.get("source_type"),
+        "language": detect_language(content),
+    }
+
+
+def _build_features(chunks: list, ids: list, path: str = None) -> tuple:
+    """
+    Evaluate the boost-rule features for every chunk; returns (signature,
+    {chunk id: mask}) and persists the masks into version dir `path`.
+    """
+    table = boost_table()
+    masks = [table.chunk_mask(_chunk_fields(c)) for c in chunks]
+    if path is not None:
+        save_feature_masks(os.path.join(path, FEATURES_FILE), ids, np.array(masks, dtype=np.int64), table)
+        print(f"    ✅ Chunk features ({len(table.names)}) saved for {len(ids):,} chunks")
+    return table.signature, dict(zip(ids, masks))
+
+
+def _load_features_snapshot(path: str):
+    """(signature, {chunk id: mask}) from version dir `path`, if computed for the current feature definitions."""
+    table = boost_table()
+    try:
+        masks = load_feature_masks(os.path.join(path, FEATURES_FILE), table)
+    except Exception as e:
+        print(f"    ⚠️  Could not read chunk features: {e}")
+        return None
+    if masks is None:
+        return None
+    print(f"    📂 Chunk features loaded ({len(masks):,} chunks)")
+    return table.signature, masks
+
+
+def _current_features(store, features) -> tuple:
+    """
+    (BoostTable, {chunk id: mask}) for the served version. If the feature
+    definitions were edited since the version was loaded, the masks are
+    recomputed once from the docstore.
+    """
+    global _chunk_features_cache
+    table = boost_table()
+    if features is not None and features[0] == table.signature:
+        return table, features[1]
+    print("\n🔁 Boost feature definitions changed — recomputing chunk features ...")
+    features = _build_features(_chunks_from_store(store), _store_ids(store))
+    with _swap_lock:
+        if _vector_store_cache is store:
+            _chunk_features_cache = features
+    return table, features[1]
+
+
+def warm_up_retrieval():
+    """
+    Load FAISS and BM25 up-front (called at server startup) so the first
+    query costs the same as every later one. Chunk texts stay on disk and
+    are decoded lazily by id.
+    """
+    vector_store, _, _, _ = _serving_index()
+    return vector_store
+
+
+def _remember_result(key, docs: list):
+    """Cache the ranked chunk ids (+ retrieval scores) of a retrieval (only for versioned indexes)."""
+    ids = [d.metadata.get("chunk_id") for d in docs]
+    if key[0] and all(ids):
+        _result_cache.put(key, [(i, d.metadata.get("retrieval_scores")) for i, d in zip(ids, docs)])
+
+
+def _with_scores(doc, scores):
+    """Copy of `doc` carrying its per-stage retrieval scores in metadata["retrieval_scores"]."""
+    if scores is None:
+        return doc
+    return doc.model_copy(update={"metadata": {**doc.metadata, "retrieval_scores": scores}})
+
+
+def _faiss_hits(vector_store, query_vector, k: int) -> tuple:
+    """
+    FAISS candidates as ([(chunk id, cosine similarity), ...], {chunk id: Document}).
+
+    Vectors are unit-normalized and the index returns squared L2 distances,
+    so cosine similarity = 1 - d / 2 (higher = better, like BM25).
+    """
+    hits, docs = [], {}
+    for doc, distance in vector_store.similarity_search_with_score_by_vector(query_vector, k=k):
+        key = doc.metadata.get("chunk_id") or doc.id
+        hits.append((key, 1.0 - float(distance) / 2.0))
+        docs[key] = doc
+    return hits, docs
+
+
+def _timed(fn, *args, **kwargs) -> tuple:
+    """(fn(*args, **kwargs), wall time in ms)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round((time.perf_counter() - start) * 1000, 2)
+
+
+def _get_retriever_pool():
+    global _retriever_pool
+    if _retriever_pool is None:
+        with _swap_lock:
+            if _retriever_pool is None:
+                _retriever_pool = ThreadPoolExecutor(
+                    max_workers=PARALLEL_RETRIEVERS, thread_name_prefix="bm25"
+                )
+    return _retriever_pool
+
+
+def _fused_candidates(vector_store, faiss_hits, faiss_docs, bm25_hits) -> list:
+    """Fuse FAISS and BM25 rankings; Documents best first with metadata["retrieval_scores"]."""
+    fused = fuse({"faiss": faiss_hits, "bm25": bm25_hits})
+    missing = [key for key, _, _ in fused if key not in faiss_docs]
+    docs = dict(faiss_docs)
+    docs.update(zip(missing, _docs_by_id(vector_store, missing)))
+    return [
+        _with_scores(docs[key], {"method": FUSION_METHOD, "fused": round(score, 6), **stages})
+        for key, score, stages in fused
+        if docs[key] is not None
+    ]
 
 
 def _deduplicate(docs: list) -> list:
@@ -231,79 +1085,155 @@ def _deduplicate(docs: list) -> list:
     return unique
 
 
-def _heuristic_sort_when_reranker_disabled(query: str, docs: list) -> list:
-    """
-    Lightweight heuristic sorting used when CrossEncoder reranking is disabled.
-    Helps ensure common "opening hours / availability" questions surface the
-    correct page chunks (e.g., functioTraining opening hours) in the top-N.
-    """
-    q = (query or "").lower()
-    wants_hours = any(
-        t in q
-        for t in (
-            "opening hours",
-            "open hours",
-            "öffnungszeiten",
-            "oeffnungszeiten",
-            "when is",
-            "wann",
-            "available",
-            "availability",
-            "open",
-            "geöffnet",
-            "geoeffnet",
-        )
-    )
-    if not wants_hours or not docs:
+def _rule_boost_sort(query: str, docs: list, table, masks: dict) -> list:
+    """
+    Reorder candidates by the boost rules of embedding/boost_rules.json (used
+    when CrossEncoder reranking is disabled or fails), e.g. so "opening hours /
+    availability" questions surface the functioTraining opening-hours chunks
+    in the top-N. Uses the chunk features precomputed at index build time;
+    ties keep the incoming (fused) order.
+    """
+    rules = table.active_rules(query)
+    if not rules or not docs:
         return docs
 
-    time_re = re.compile(r"\b\d{1,2}:\d{2}\b")
-
     scored = []
     for idx, doc in enumerate(docs):
-        name = (
-            (doc.metadata.get("page_name") or doc.metadata.get("source_pdf") or "")
-            .lower()
-            .strip()
-        )
-        content = (doc.page_content or "").lower()
+        mask = masks.get(doc.metadata.get("chunk_id"))
+        if mask is None:
+            mask = table.chunk_mask(_chunk_fields(doc))
+        score = 0.0
+        for rule_mask, boost in rules:
+            if mask & rule_mask == rule_mask:
+                score += boost
+        scored.append((-score, idx, doc))
+
+    scored.sort(key=lambda x: (x[0], x[1]))
+    return [d for _, __, d in scored]
+
+
+# ─────────────────────────────────────────────
+# Cascade reranking
+# ─────────────────────────────────────────────
+
+def _truncate_for_rerank(text: str) -> str:
+    """Truncate long docs so CrossEncoder input stays within model limits."""
+    if not text or not text.strip():
+        return " "
+    text = text.strip()
+    if len(text) <= RERANKER_DOC_MAX_CHARS:
+        return text
+    return text[: RERANKER_DOC_MAX_CHARS].rsplit(" ", 1)[0] or text[: RERANKER_DOC_MAX_CHARS]
+
+
+def _pair_token_lengths(reranker, query: str, texts: list) -> list:
+    """Token count of each (query, text) CrossEncoder input after truncation."""
+    tokenizer = getattr(reranker, "tokenizer", None)
+    if tokenizer is None:
+        return [(len(query) + len(t)) // 4 + 3 for t in texts]
+    encoded = tokenizer(
+        [query] * len(texts), texts, truncation=True,
+        max_length=getattr(reranker, "max_length", None) or 512,
+    )
+    return [len(ids) for ids in encoded["input_ids"]]
 
-        score = 0
 
-        # Prefer the actual functioTraining pages
-        if "functiotraining" in name:
-            score += 12
-        if "angebot_functiotraining" in name or "en_angebot_functiotraining" in name:
-            score += 20
+def _next_batch(lengths: list, start: int) -> int:
+    """End of the batch starting at `start`: as many pairs as fit RERANKER_BATCH_TOKENS padded tokens."""
+    end, longest = start + 1, lengths[start]
+    while end < len(lengths) and end - start < RERANKER_BATCH_SIZE:
+        longest_next = max(longest, lengths[end])
+        if longest_next * (end - start + 1) > RERANKER_BATCH_TOKENS:
+            break
+        longest = longest_next
+        end += 1
+    return end
 
-        # Prefer chunks that mention opening hours / training area hours
-        if "öffnungszeiten" in content or "oeffnungszeiten" in content or "opening hours" in content:
-            score += 10
-        if "trainingsfläche" in content or "trainingsflaeche" in content or "trainingsfla" in content:
-            score += 6
 
-        # Prefer chunks that contain explicit time patterns
-        if time_re.search(content):
-            score += 3
+def _rerank_scores(query: str, docs: list, index_version, timings: dict) -> dict:
+    """
+    CrossEncoder scores {position in docs: score} for the first RERANK_TOP_M
+    docs, best-fused first, within RERANK_BUDGET_MS (cached scores are free).
+    """
+    # Keyed by the normalized query, like the query-embedding and result caches
+    cache_query = normalize_query(query)
+    scores, todo = {}, []
+    for i, doc in enumerate(docs[:RERANK_TOP_M]):
+        cached = _rerank_score_cache.get((index_version, cache_query, doc.metadata.get("chunk_id")))
+        if cached is None:
+            todo.append(i)
+        else:
+            scores[i] = cached
+    timings["rerank_cached"] = len(scores)
+    if not todo:
+        return scores
+
+    reranker = load_reranker()
+    texts = [_truncate_for_rerank(docs[i].page_content) for i in todo]
+    lengths = _pair_token_lengths(reranker, query, texts)
+
+    start, padded_tokens, batches, pos = time.perf_counter(), 0, 0, 0
+    while pos < len(todo):
+        end = _next_batch(lengths, pos)
+        batch_tokens = max(lengths[pos:end]) * (end - pos)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        # Cost of the next batch estimated from the throughput so far
+        if padded_tokens and elapsed_ms + elapsed_ms / padded_tokens * batch_tokens > RERANK_BUDGET_MS:
+            print(f"    ⏱️  Rerank budget {RERANK_BUDGET_MS:.0f} ms reached — {len(todo) - pos} candidates left unscored")
+            break
+        batch_scores = _rerank_batcher.submit([(query, texts[j], lengths[j]) for j in range(pos, end)])
+        for j, score in zip(range(pos, end), batch_scores):
+            doc = docs[todo[j]]
+            scores[todo[j]] = float(score)
+            if doc.metadata.get("chunk_id"):
+                _rerank_score_cache.put((index_version, cache_query, doc.metadata["chunk_id"]), float(score))
+        padded_tokens += batch_tokens
+        batches += 1
+        pos = end
+
+    timings["rerank_scored"] = pos
+    timings["rerank_batches"] = batches
+    return scores
+
+
+def _predict_pairs(items: list) -> list:
+    """
+    CrossEncoder scores for (query, text, n_tokens) items from one or more
+    requests, sorted by length and packed into RERANKER_BATCH_TOKENS batches.
+    """
+    reranker = load_reranker()
+    order = sorted(range(len(items)), key=lambda i: items[i][2])
+    lengths = [items[i][2] for i in order]
+    scores = [0.0] * len(items)
+    pos = 0
+    while pos < len(order):
+        end = _next_batch(lengths, pos)
+        batch = order[pos:end]
+        for i, score in zip(batch, reranker.predict([[items[i][0], items[i][1]] for i in batch])):
+            scores[i] = float(score)
+        pos = end
+    return scores
 
-        scored.append((score, idx, doc))
 
-    scored.sort(key=lambda x: (-x[0], x[1]))
-    return [d for _, __, d in scored]
+_rerank_batcher = MicroBatcher("rerank", _predict_pairs, RERANK_MICROBATCH_MAX)
 
 
 # ─────────────────────────────────────────────
 # MAIN RETRIEVAL
 # ─────────────────────────────────────────────
 
-def retrieve(query: str, top_n: int = 6) -> list:
+def retrieve(query: str, top_n: int = 6, timings: dict = None) -> list:
     """
     Query-aware adaptive retrieval:
     - Detects query intent (information vs form)
     - For information queries: Heavily boosts web content
     - For form queries: Allows more PDF content
     - Uses strict relevance filtering
+
+    If `timings` is given, per-stage wall times (ms) are written into it.
     """
+    timings = {} if timings is None else timings
+    retrieve_start = time.perf_counter()
     try:
         print("\n" + "=" * 70)
         print("🔍 QUERY-AWARE ADAPTIVE RETRIEVAL")
@@ -329,38 +1259,64 @@ def retrieve(query: str, top_n: int = 6) -> list:
         print(f"Normalized query: '{normalized_q}'")
         print(f"Target          : {top_n} docs  |  Threshold: {RELEVANCE_THRESHOLD}")
 
-        # Load resources
-        vector_store = build_or_load_vectorstore()
-        all_chunks, web_chunks, pdf_chunks = load_all_chunks()
+        # Load resources (one consistent index version for the whole query)
+        vector_store, bm25, index_version, features = _serving_index()
+
+        # Same question against the same index version → reuse the ranking
+        result_key = (index_version, normalized_q, top_n, intent)
+        cached_ids = _result_cache.get(result_key) if index_version else None
+        if cached_ids is not None:
+            docs = _docs_by_id(vector_store, [doc_id for doc_id, _ in cached_ids])
+            if all(doc is not None for doc in docs):
+                timings["result_cache_hit"] = True
+                print(f"\n⚡ Result cache hit — returning {len(cached_ids)} cached chunks")
+                print("=" * 70 + "\n")
+                return [_with_scores(doc, scores) for doc, (_, scores) in zip(docs, cached_ids)]
+            print("\n⚠️  Cached result refers to chunks not in the served index — retrieving again")
+
+        n_web, n_pdf = _source_counts(vector_store)
 
         n_candidates = top_n * CANDIDATE_MULTIPLIER
-        print(f"\n📊 Available: {len(web_chunks)} web  |  {len(pdf_chunks)} PDF")
+        print(f"\n📊 Available: {n_web} web  |  {n_pdf} PDF")
         print(f"    Fetching {n_candidates} candidates from each retriever")
 
+        # STEP 1 + 2 in parallel: BM25 on the side pool, query encoding + FAISS here
+        steps_start = time.perf_counter()
+        bm25_future = (
+            _get_retriever_pool().submit(_timed, bm25.search, normalized_q, n_candidates, matched_only=True)
+            if PARALLEL_RETRIEVERS > 0 else None
+        )
+
         # STEP 1: FAISS
         print(f"\n🔹 STEP 1: FAISS Semantic Search  (k={n_candidates})")
-        faiss_retriever = vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": n_candidates},
-        )
-        faiss_docs = faiss_retriever.invoke(query)
+        query_vector, timings["encode_ms"] = _timed(embed_query, query)
+        (faiss_hits, faiss_by_id), timings["faiss_ms"] = _timed(_faiss_hits, vector_store, query_vector, n_candidates)
+        faiss_docs = list(faiss_by_id.values())
         faiss_web = [d for d in faiss_docs if d.metadata.get("source_type") == "web"]
         faiss_pdf = [d for d in faiss_docs if d.metadata.get("source_type") == "pdf"]
         print(f"    Retrieved: {len(faiss_web)} web  |  {len(faiss_pdf)} PDF")
 
         # STEP 2: BM25
         print(f"\n🔹 STEP 2: BM25 Keyword Search  (k={n_candidates})")
-        bm25 = get_bm25(all_chunks)
-        bm25.k = n_candidates
-        bm25_docs = bm25.invoke(normalized_q)
-        bm25_web = [d for d in bm25_docs if d.metadata.get("source_type") == "web"]
-        bm25_pdf = [d for d in bm25_docs if d.metadata.get("source_type") == "pdf"]
-        print(f"    Retrieved: {len(bm25_web)} web  |  {len(bm25_pdf)} PDF")
-
-        # STEP 3: Combine
-        print(f"\n🔹 STEP 3: Combine & Deduplicate")
-        combined = _deduplicate(faiss_docs + bm25_docs)
-        print(f"    Unique candidates: {len(combined)}")
+        # Chunks without any query term are left out; they would only add RRF noise
+        if bm25_future is not None and not bm25_future.cancel():
+            bm25_hits, timings["bm25_ms"] = bm25_future.result()
+        else:
+            # Side pool saturated (task not started yet) → cheaper to run it here
+            bm25_hits, timings["bm25_ms"] = _timed(bm25.search, normalized_q, n_candidates, matched_only=True)
+        timings["retrievers_ms"] = round((time.perf_counter() - steps_start) * 1000, 2)
+        print(f"    Retrieved: {len(bm25_hits)} chunks")
+        print(
+            f"\n⏱️  encode {timings['encode_ms']} ms + FAISS {timings['faiss_ms']} ms  ‖  "
+            f"BM25 {timings['bm25_ms']} ms  →  wall {timings['retrievers_ms']} ms"
+        )
+
+        # STEP 3: Fuse the two rankings (scores kept per stage on each doc)
+        print(f"\n🔹 STEP 3: Score Fusion ({FUSION_METHOD}) & Deduplicate")
+        fused, timings["fusion_ms"] = _timed(_fused_candidates, vector_store, faiss_hits, faiss_by_id, bm25_hits)
+        combined = _deduplicate(fused)
+        overlap = len(set(k for k, _ in faiss_hits) & set(k for k, _ in bm25_hits))
+        print(f"    Unique candidates: {len(combined)}  (in both retrievers: {overlap})")
 
         if not combined:
             print("    ⚠️  No candidates found.")
@@ -368,8 +1324,8 @@ def retrieve(query: str, top_n: int = 6) -> list:
 
         # STEP 4: Rerank (optional; disable to avoid OOM/timeout — set RERANKER_ENABLED=1 to enable)
         if not RERANKER_ENABLED:
-            print(f"\n🔹 STEP 4: Reranking disabled — using combined order for top {top_n}")
-            combined = _heuristic_sort_when_reranker_disabled(query, combined)
+            print(f"\n🔹 STEP 4: Reranking disabled — using fused order for top {top_n}")
+            combined = _rule_boost_sort(query, combined, *_current_features(vector_store, features))
             final_docs = combined[:top_n]
             actual_web = sum(1 for d in final_docs if d.metadata.get("source_type") == "web")
             actual_pdf = sum(1 for d in final_docs if d.metadata.get("source_type") == "pdf")
@@ -382,32 +1338,28 @@ def retrieve(query: str, top_n: int = 6) -> list:
                 stype = doc.metadata.get("source_type", "?")
                 icon = "🌐" if stype == "web" else "📑"
                 name = doc.metadata.get("page_name") or doc.metadata.get("source_pdf", "Unknown")
+                scores = doc.metadata.get("retrieval_scores", {})
+                ranks = "  ".join(f"{s} #{scores[s]['rank']}" for s in ("faiss", "bm25") if s in scores)
                 print(f"\n    {i}. {icon} [{stype.upper()}] {name}")
+                print(f"       Fused: {scores.get('fused', 0):.4f}  ({ranks})")
                 print(f"       Preview: {doc.page_content[:100]}...")
             print("\n" + "=" * 70 + "\n")
+            _remember_result(result_key, final_docs)
             return final_docs
 
-        print(f"\n🔹 STEP 4: CrossEncoder Reranking with Intent-Based Boost")
-        reranker = load_reranker()
-        # Truncate long docs so CrossEncoder input stays within model limits
-        def _truncate_for_rerank(text: str) -> str:
-            if not text or not text.strip():
-                return " "
-            text = text.strip()
-            if len(text) <= RERANKER_DOC_MAX_CHARS:
-                return text
-            return text[: RERANKER_DOC_MAX_CHARS].rsplit(" ", 1)[0] or text[: RERANKER_DOC_MAX_CHARS]
-
-        pairs = [[query, _truncate_for_rerank(doc.page_content)] for doc in combined]
-
+        n_rerank = min(RERANK_TOP_M, len(combined))
+        print(f"\n🔹 STEP 4: Cascade Reranking (CrossEncoder on top {n_rerank} of {len(combined)} fused) with Intent-Based Boost")
         try:
-            scores = []
-            for i in range(0, len(pairs), RERANKER_BATCH_SIZE):
-                batch = pairs[i : i + RERANKER_BATCH_SIZE]
-                scores.extend(reranker.predict(batch))
+            rerank_scores, timings["rerank_ms"] = _timed(_rerank_scores, query, combined, index_version, timings)
+            if not rerank_scores:
+                raise RuntimeError("no candidate was reranked")
+            print(
+                f"    Scored {len(rerank_scores)} ({timings['rerank_cached']} cached, "
+                f"{timings.get('rerank_batches', 0)} batches) in {timings['rerank_ms']} ms"
+            )
         except Exception as rerank_err:
             print(f"    ⚠️  Reranker failed: {rerank_err} — using combined order for top {top_n}")
-            combined = _heuristic_sort_when_reranker_disabled(query, combined)
+            combined = _rule_boost_sort(query, combined, *_current_features(vector_store, features))
             final_docs = combined[:top_n]
             actual_web = sum(1 for d in final_docs if d.metadata.get("source_type") == "web")
             actual_pdf = sum(1 for d in final_docs if d.metadata.get("source_type") == "pdf")
@@ -415,6 +1367,13 @@ def retrieve(query: str, top_n: int = 6) -> list:
             print("=" * 70 + "\n")
             return final_docs
 
+        reranked = sorted(rerank_scores)
+        scores = [rerank_scores[i] for i in reranked]
+        unscored = [(doc, None, None) for i, doc in enumerate(combined) if i not in rerank_scores]
+        combined = [combined[i] for i in reranked]
+        for doc, score in zip(combined, scores):
+            doc.metadata.get("retrieval_scores", {})["rerank"] = round(score, 4)
+
         # Apply web boost (additive so higher = better, even when scores are negative)
         boosted_scores = []
         for doc, score in zip(combined, scores):
@@ -438,11 +1397,15 @@ def retrieve(query: str, top_n: int = 6) -> list:
         above = [(d, bs, os) for d, bs, os in ranked if bs >= RELEVANCE_THRESHOLD]
         below = [(d, bs, os) for d, bs, os in ranked if bs < RELEVANCE_THRESHOLD]
         print(f"    Above threshold: {len(above)}   |   Discarded (below threshold): {len(below)}")
+        if unscored:
+            # Beyond the cascade cut-off / latency budget: fused order, after all reranked docs
+            print(f"    Not reranked   : {len(unscored)} (kept in fused order as fallback)")
+            below += unscored
 
         if not above:
             # No hits above threshold → just take the best overall
             print(f"    ⚠️  All below threshold — taking top {top_n} by boosted score")
-            candidate_pool = ranked[:top_n]
+            candidate_pool = (ranked + unscored)[:top_n]
         elif len(above) >= top_n:
             # Plenty of good hits → just use the top-N above threshold
             candidate_pool = above[:top_n]
@@ -472,10 +1435,14 @@ def retrieve(query: str, top_n: int = 6) -> list:
             boost_note = f" (from {original:.4f})" if boosted != original else ""
             
             print(f"\n    {i}. {icon} [{stype.upper()}] {name}")
-            print(f"       Score: {boosted:.4f}{boost_note}")
+            if boosted is None:
+                print(f"       Score: not reranked (fused {doc.metadata.get('retrieval_scores', {}).get('fused', 0):.4f})")
+            else:
+                print(f"       Score: {boosted:.4f}{boost_note}")
             print(f"       Preview: {doc.page_content[:100]}...")
 
         print("\n" + "=" * 70 + "\n")
+        _remember_result(result_key, final_docs)
         return final_docs
 
     except Exception as e:
@@ -483,4 +1450,6 @@ def retrieve(query: str, top_n: int = 6) -> list:
         import traceback
         traceback.print_exc()
         return []
+    finally:
+        timings["total_ms"] = round((time.perf_counter() - retrieve_start) * 1000, 2)
     
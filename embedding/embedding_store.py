@@ -0,0 +1,187 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# ─────────────────────────────────────────────
+# Persistent chunk embedding store
+# ─────────────────────────────────────────────
+#
+# <dir>/meta.json    {"model": ..., "dim": ...}
+# <dir>/vectors.f32  float32 rows, append-only, read through np.memmap
+# <dir>/keys.txt     one sha256(model, text) hex digest per row, append-only
+#
+# keys.txt is written after vectors.f32, so a row only becomes visible once
+# both are on disk; a partly written tail is truncated on open. Several worker
+# processes share one store: opening and appending hold an exclusive flock on
+# <dir>/.lock, and rows appended by other processes are picked up from keys.txt
+# before new rows are assigned.
+
+
+def text_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Maps hash(model, chunk text) → embedding, shared across index rebuilds."""
+
+    def __init__(self, path: str, model: str):
+        self.path = path
+        self.model = model
+        self.dim = None
+        self._lock = threading.Lock()
+        self._rows = {}             # key → row
+        self._n = 0                 # rows known to this instance
+        self._keys_offset = 0       # bytes of keys.txt already read
+        self._matrix = None         # memmap over vectors.f32 (None when empty)
+        os.makedirs(path, exist_ok=True)
+        with self._file_lock():
+            self._open()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.path, "keys.txt")
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock across processes sharing this store directory."""
+        with open(os.path.join(self.path, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _open(self):
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+
+        if meta is None or meta.get("model") != self.model:
+            # New store (or one written for another model) — start empty
+            for p in (self._vectors_path, self._keys_path, self._meta_path):
+                if os.path.exists(p):
+                    os.remove(p)
+            return
+
+        self.dim = int(meta["dim"])
+        keys = []
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "r", encoding="ascii") as f:
+                keys = [line.strip() for line in f if line.strip()]
+
+        row_bytes = 4 * self.dim
+        stored = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+        n = min(len(keys), stored)
+        if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) != n * row_bytes:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(n * row_bytes)
+        if len(keys) != n:
+            keys = keys[:n]
+            with open(self._keys_path, "w", encoding="ascii") as f:
+                f.writelines(k + "\n" for k in keys)
+
+        self._rows = {}
+        for i, k in enumerate(keys):
+            self._rows.setdefault(k, i)
+        self._n = n
+        self._keys_offset = os.path.getsize(self._keys_path) if os.path.exists(self._keys_path) else 0
+        self._remap()
+
+    def _sync(self):
+        """Pick up rows other processes appended since this instance last looked (self._lock held)."""
+        try:
+            size = os.path.getsize(self._keys_path)
+        except OSError:
+            return
+        if size <= self._keys_offset:
+            return
+        if self.dim is None:
+            try:
+                with open(self._meta_path, "r", encoding="utf-8") as f:
+                    self.dim = int(json.load(f)["dim"])
+            except (OSError, ValueError, KeyError):
+                return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read(size - self._keys_offset)
+        complete = data[: data.rfind(b"\n") + 1]   # a line still being written is read next time
+        for line in complete.decode("ascii").splitlines():
+            if line.strip():
+                self._rows.setdefault(line.strip(), self._n)
+                self._n += 1
+        self._keys_offset += len(complete)
+        self._remap()
+
+    def _remap(self):
+        n = self._n
+        self._matrix = (
+            np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+            if n else None
+        )
+
+    def get_many(self, texts: list) -> tuple:
+        """Return ({index in texts: vector}, [indices of texts with no stored vector])."""
+        found, missing = {}, []
+        with self._lock:
+            self._sync()
+            for i, text in enumerate(texts):
+                row = self._rows.get(text_key(self.model, text))
+                if row is None:
+                    missing.append(i)
+                else:
+                    found[i] = np.array(self._matrix[row])
+        return found, missing
+
+    def put_many(self, texts: list, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(texts):
+            return
+        with self._lock, self._file_lock():
+            self._sync()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dim": self.dim}, f)
+
+            new_keys, new_rows, seen = [], [], set()
+            for text, vector in zip(texts, vectors):
+                key = text_key(self.model, text)
+                if key in self._rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+
+            # New rows go right after the last row named in keys.txt (dropping
+            # vectors of an append that died before its keys were written)
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(self._n * 4 * self.dim)
+                f.write(np.vstack(new_rows).tobytes())
+            with open(self._keys_path, "a", encoding="ascii") as f:
+                f.writelines(k + "\n" for k in new_keys)
+                self._keys_offset = f.tell()
+
+            for key in new_keys:
+                self._rows[key] = self._n
+                self._n += 1
+            self._remap()
+
+    def __len__(self):
+        return len(self._rows)
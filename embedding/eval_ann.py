@@ -0,0 +1,112 @@
+"""
+Recall vs latency of the FAISS index types on the served corpus.
+
+    python -m embedding.eval_ann --k 10 --sample-chunks 200
+
+Every configuration (flat, HNSW with several M / efSearch, IVF-PQ with
+several nprobe) is built from the current index version's vectors and
+compared against exact search on the same queries: recall@k, mean / p95
+search latency, index size and build time. Pick one and set INDEX_TYPE
+(+ HNSW_* / IVF_* / PQ_*) before the next /ingest.
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from embedding.ann import build_index, set_search_params
+from embedding.check_backend import QUERIES
+from embedding.embedding import (
+    _chunks_from_store,
+    build_or_load_vectorstore,
+    embed_documents,
+    embed_query,
+)
+
+
+def _queries(args, docs) -> list:
+    queries = list(QUERIES)
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries += [line.strip() for line in f if line.strip()]
+    if args.sample_chunks and docs:
+        # Opening words of corpus chunks as extra pseudo-queries
+        picks = np.linspace(0, len(docs) - 1, min(args.sample_chunks, len(docs))).astype(int)
+        queries += [" ".join(docs[i].page_content.split()[:12]) for i in picks]
+    return queries
+
+
+def _measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    found = np.empty_like(truth)
+    timings = []
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        timings.append(time.perf_counter() - start)
+        found[i] = ids[0]
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+    timings = np.asarray(timings) * 1000
+    return {"recall": recall, "mean_ms": timings.mean(), "p95_ms": np.percentile(timings, 95)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", help="extra queries, one per line")
+    parser.add_argument("--sample-chunks", type=int, default=200, help="chunk openings used as extra queries")
+    parser.add_argument("--hnsw-m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--pq-m", type=int, default=0, help="PQ sub-quantizers (0 → largest of 48/32/24/16/8 dividing dim)")
+    args = parser.parse_args(argv)
+
+    print("\n" + "=" * 70)
+    print("🧭 ANN INDEX EVALUATION")
+    print("=" * 70)
+
+    docs = _chunks_from_store(build_or_load_vectorstore())
+    vectors = embed_documents([d.page_content for d in docs])
+    n, dim = vectors.shape
+    queries = _queries(args, docs)
+    q = np.asarray([embed_query(text) for text in queries], dtype=np.float32)
+    k = min(args.k, n)
+    print(f"\n📚 {n:,} vectors (dim {dim}), {len(queries)} queries, k={k}")
+
+    exact, _ = build_index(vectors, {"type": "flat"})
+    _, truth = exact.search(q, k)
+
+    rows = []
+
+    def run(label, params, variants):
+        start = time.perf_counter()
+        index, built = build_index(vectors, params)
+        build_s = time.perf_counter() - start
+        size_mb = len(faiss.serialize_index(index)) / 1e6
+        for knob, search_params in variants(built):
+            set_search_params(index, search_params)
+            rows.append({"config": f"{label} {knob}".strip(), "build_s": build_s, "size_mb": size_mb,
+                         **_measure(index, q, truth, k)})
+
+    run("flat", {"type": "flat"}, lambda built: [("", built)])
+    for m in args.hnsw_m:
+        run(f"hnsw M={m}", {"type": "hnsw", "m": m, "ef_construction": 200, "ef_search": args.ef_search[0]},
+            lambda built: [(f"ef={ef}", {**built, "ef_search": ef}) for ef in args.ef_search])
+    pq_m = args.pq_m or next((m for m in (48, 32, 24, 16, 8) if dim % m == 0), 1)
+    run(f"ivfpq pq_m={pq_m}", {"type": "ivfpq", "nlist": 0, "nprobe": 1, "pq_m": pq_m, "pq_nbits": 8},
+        lambda built: [
+            (f"nlist={built['nlist']} nprobe={p}", {**built, "nprobe": p})
+            for p in sorted({min(p, built["nlist"]) for p in args.nprobe})
+        ] if built["type"] == "ivfpq" else [("(fell back to flat)", built)])
+
+    print(f"\n{'config':<34} {'recall@' + str(k):>9} {'mean ms':>9} {'p95 ms':>9} {'size MB':>9} {'build s':>9}")
+    print("-" * 84)
+    for r in rows:
+        print(f"{r['config']:<34} {r['recall']:>9.3f} {r['mean_ms']:>9.3f} {r['p95_ms']:>9.3f} "
+              f"{r['size_mb']:>9.2f} {r['build_s']:>9.2f}")
+    print("=" * 70 + "\n")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
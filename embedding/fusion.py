@@ -0,0 +1,67 @@
+import os
+
+# ─────────────────────────────────────────────
+# Hybrid score fusion (FAISS + BM25)
+# ─────────────────────────────────────────────
+#
+#   rrf       — reciprocal rank fusion: Σ weight / (RRF_K + rank). Only ranks
+#               matter, so cosine similarities and BM25+ scores need no
+#               calibration against each other.
+#   weighted  — each engine's scores are min-max normalized over its own hits
+#               and summed with the weights; a document missing from one
+#               engine's list gets 0 from it.
+#
+# Every stage passes [(key, score), ...] best first, higher score = better.
+
+FUSION_METHODS = ("rrf", "weighted")
+
+FUSION_METHOD = os.getenv("FUSION_METHOD", "rrf").strip().lower()
+RRF_K = int(os.getenv("RRF_K", "60"))
+FUSION_WEIGHT_FAISS = float(os.getenv("FUSION_WEIGHT_FAISS", "1.0"))
+FUSION_WEIGHT_BM25 = float(os.getenv("FUSION_WEIGHT_BM25", "1.0"))
+
+
+def configured_weights() -> dict:
+    return {"faiss": FUSION_WEIGHT_FAISS, "bm25": FUSION_WEIGHT_BM25}
+
+
+def _min_max(scores: list) -> list:
+    lo, hi = min(scores), max(scores)
+    if hi == lo:
+        return [1.0] * len(scores)
+    return [(s - lo) / (hi - lo) for s in scores]
+
+
+def fuse(rankings: dict, method: str = None, weights: dict = None) -> list:
+    """
+    Fuse per-engine rankings into one list.
+
+    rankings: {stage name: [(key, score), ...] best first}
+    Returns [(key, fused score, {stage: {"rank": 1-based, "score": raw}}), ...]
+    best first; ties keep the order in which keys were first seen.
+    """
+    method = method or FUSION_METHOD
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown FUSION_METHOD {method!r} (expected one of {', '.join(FUSION_METHODS)})")
+    weights = weights or configured_weights()
+
+    fused, stages, order = {}, {}, []
+    for stage, hits in rankings.items():
+        weight = weights.get(stage, 1.0)
+        normalized = _min_max([s for _, s in hits]) if method == "weighted" and hits else None
+        for rank, (key, score) in enumerate(hits, 1):
+            if key not in fused:
+                fused[key] = 0.0
+                stages[key] = {}
+                order.append(key)
+            if stage in stages[key]:
+                continue  # same key twice in one engine's list → keep the better rank
+            stages[key][stage] = {"rank": rank, "score": float(score)}
+            if method == "rrf":
+                fused[key] += weight / (RRF_K + rank)
+            else:
+                fused[key] += weight * normalized[rank - 1]
+
+    position = {key: i for i, key in enumerate(order)}
+    ranked = sorted(order, key=lambda k: (-fused[k], position[k]))
+    return [(key, fused[key], stages[key]) for key in ranked]
@@ -0,0 +1,150 @@
+import json
+import mmap
+import os
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from embedding.ann import build_index, set_search_params
+
+# ─────────────────────────────────────────────
+# Pickle-free FAISS persistence
+# ─────────────────────────────────────────────
+#
+# <dir>/index.faiss     raw FAISS index (faiss.write_index)
+# <dir>/docstore.bin    one UTF-8 JSON record {"t": text, "m": metadata} per
+#                       vector, concatenated in index order
+# <dir>/docstore.npz    docstore ids + int64 record offsets (no pickle)
+# <dir>/index_params.json  index type + build/search parameters (embedding/ann.py)
+#
+# For serving, the index is memory-mapped read-only and records are decoded
+# lazily by id, so several workers share the same pages through the OS page
+# cache. A read-only mapped index must never be mutated (FAISS aborts the
+# process) — incremental updates load a writable copy instead.
+
+FAISS_FILE = "index.faiss"
+DOCSTORE_DATA = "docstore.bin"
+DOCSTORE_INDEX = "docstore.npz"
+INDEX_PARAMS = "index_params.json"
+LEGACY_PICKLE = "index.pkl"
+
+
+class LazyDocstore(Docstore):
+    """Read-only docstore that decodes chunk records from an mmap'ed file on lookup."""
+
+    def __init__(self, data_path: str, ids: list, offsets: np.ndarray):
+        self._offsets = offsets
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._file = open(data_path, "rb")
+        self._data = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if os.path.getsize(data_path) else b""
+        )
+
+    def search(self, search: str):
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        record = json.loads(self._data[self._offsets[row] : self._offsets[row + 1]])
+        return Document(id=search, page_content=record["t"], metadata=record["m"])
+
+    def __len__(self):
+        return len(self._rows)
+
+
+def has_index(path: str) -> bool:
+    return all(os.path.exists(os.path.join(path, f)) for f in (FAISS_FILE, DOCSTORE_DATA, DOCSTORE_INDEX))
+
+
+def is_legacy_index(path: str) -> bool:
+    """True for an index saved by FAISS.save_local (pickled docstore)."""
+    return os.path.exists(os.path.join(path, LEGACY_PICKLE)) and not has_index(path)
+
+
+def read_index_params(path: str) -> dict:
+    """{"requested": ..., "built": ...} parameters of the index at `path` (flat if not recorded)."""
+    try:
+        with open(os.path.join(path, INDEX_PARAMS), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"requested": {"type": "flat"}, "built": {"type": "flat"}}
+
+
+def save_index(store, path: str, params: dict = None):
+    """
+    Write `store` (vectors, texts, metadata) to `path` without pickle.
+
+    `store.index` must be a flat (exact) index; it is converted to the index
+    type in `params` (default flat) on the way to disk.
+    """
+    os.makedirs(path, exist_ok=True)
+    ids = [store.index_to_docstore_id[i] for i in range(store.index.ntotal)]
+    params = params or {"type": "flat"}
+    if not isinstance(store.index, faiss.IndexFlat):
+        raise ValueError(f"save_index expects a flat working index, got {type(store.index).__name__}")
+
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    data_tmp = os.path.join(path, DOCSTORE_DATA + ".tmp")
+    with open(data_tmp, "wb") as f:
+        for row, doc_id in enumerate(ids):
+            doc = store.docstore.search(doc_id)
+            record = json.dumps({"t": doc.page_content, "m": doc.metadata}, ensure_ascii=False).encode("utf-8")
+            f.write(record)
+            offsets[row + 1] = offsets[row] + len(record)
+
+    index_tmp = os.path.join(path, DOCSTORE_INDEX + ".tmp.npz")
+    np.savez(index_tmp, ids=np.array(ids, dtype=str), offsets=offsets)
+
+    index, built = store.index, {"type": "flat"}
+    if params["type"] != "flat" and ids:
+        print(f"    🧭 Building {params['type']} index over {len(ids):,} vectors ...")
+        index, built = build_index(store.index.reconstruct_n(0, len(ids)), params)
+    faiss_tmp = os.path.join(path, FAISS_FILE + ".tmp")
+    faiss.write_index(index, faiss_tmp)
+
+    with open(os.path.join(path, INDEX_PARAMS), "w", encoding="utf-8") as f:
+        json.dump({"requested": params, "built": built}, f, indent=1)
+
+    os.replace(data_tmp, os.path.join(path, DOCSTORE_DATA))
+    os.replace(index_tmp, os.path.join(path, DOCSTORE_INDEX))
+    os.replace(faiss_tmp, os.path.join(path, FAISS_FILE))
+
+    legacy = os.path.join(path, LEGACY_PICKLE)
+    if os.path.exists(legacy):
+        os.remove(legacy)
+
+
+def load_index(path: str, embedding, writable: bool = False):
+    """
+    Load an index written by save_index().
+
+    Default: FAISS index mmap'ed read-only + LazyDocstore (for serving).
+    writable=True: index and all documents in memory (for incremental updates;
+    approximate index types still have to be swapped for a flat one before
+    they can be modified and saved again).
+    """
+    with np.load(os.path.join(path, DOCSTORE_INDEX), allow_pickle=False) as npz:
+        ids = npz["ids"].tolist()
+        offsets = npz["offsets"]
+
+    faiss_path = os.path.join(path, FAISS_FILE)
+    data_path = os.path.join(path, DOCSTORE_DATA)
+    if writable:
+        index = faiss.read_index(faiss_path)
+        lazy = LazyDocstore(data_path, ids, offsets)
+        docstore = InMemoryDocstore({doc_id: lazy.search(doc_id) for doc_id in ids})
+    else:
+        index = faiss.read_index(faiss_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        docstore = LazyDocstore(data_path, ids, offsets)
+    set_search_params(index, read_index_params(path)["built"])
+
+    return FAISS(
+        embedding_function=embedding,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
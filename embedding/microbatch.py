@@ -0,0 +1,101 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# ─────────────────────────────────────────────
+# Cross-request micro-batching
+# ─────────────────────────────────────────────
+#
+# Concurrent requests each encode one query / a few reranker pairs; run one at
+# a time, the transformer does many tiny forward passes. A MicroBatcher runs
+# submissions on its own thread and hands every caller back its slice of the
+# results; items of one submission always stay together and in order.
+#
+# A lone submission (nothing else queued) is dispatched at once. Submissions
+# that arrive while a batch is running queue up and form the next batch; when
+# several are already queued, the batcher waits up to MICROBATCH_WAIT_MS for
+# the rest of the burst (or until MAX items). If a batch fails, its items are
+# retried one at a time so only the submissions with a bad item fail.
+
+MICROBATCH_WAIT_MS = float(os.getenv("MICROBATCH_WAIT_MS", "5"))  # 0 → no batching
+QUERY_MICROBATCH_MAX = int(os.getenv("QUERY_MICROBATCH_MAX", "32"))
+RERANK_MICROBATCH_MAX = int(os.getenv("RERANK_MICROBATCH_MAX", "64"))
+
+
+class MicroBatcher:
+    """Runs `fn(items) -> results` over items collected from concurrent callers."""
+
+    def __init__(self, name: str, fn, max_items: int, wait_ms: float = MICROBATCH_WAIT_MS):
+        self.name = name
+        self.fn = fn
+        self.max_items = max_items
+        self.wait = wait_ms / 1000
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+    def submit(self, items: list) -> list:
+        """Results for `items` (blocks until the batch containing them has run)."""
+        if not items:
+            return []
+        if self.wait <= 0:
+            return list(self.fn(items))
+        future = Future()
+        self._ensure_worker().put((items, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        # Threads do not survive fork (gunicorn preload_app) → one worker per process
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name=f"microbatch-{self.name}", daemon=True).start()
+            return self._queue
+
+    def _run(self, requests):
+        while True:
+            batch = [requests.get()]
+            n_items = len(batch[0][0])
+            # Take what is already queued; nothing queued → run the lone submission now
+            while n_items < self.max_items:
+                try:
+                    request = requests.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_items += len(request[0])
+            deadline = time.monotonic() + self.wait
+            while len(batch) > 1 and n_items < self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_items += len(request[0])
+            self._execute(batch)
+
+    def _execute(self, batch: list):
+        items = [item for request_items, _ in batch for item in request_items]
+        try:
+            results = list(self.fn(items))
+        except Exception as e:
+            if len(items) == 1:
+                batch[0][1].set_exception(e)
+                return
+            print(f"⚠️  Micro-batch {self.name} of {len(items)} items failed ({e}) — retrying items one by one")
+            for request_items, future in batch:
+                try:
+                    future.set_result([self.fn([item])[0] for item in request_items])
+                except Exception as item_error:
+                    future.set_exception(item_error)
+            return
+        start = 0
+        for request_items, future in batch:
+            future.set_result(results[start : start + len(request_items)])
+            start += len(request_items)
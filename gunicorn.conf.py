@@ -0,0 +1,26 @@
+# Multi-worker deployment:
+#
+#     gunicorn -c gunicorn.conf.py main:app
+#
+# The app (and the model weights, via PRELOAD_MODELS) is loaded once in the
+# master and shared copy-on-write by the forked workers. The FAISS index is
+# memory-mapped per worker from the published version under data/faiss_index/
+# and hot-swapped when /ingest publishes a new one.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(max(2, multiprocessing.cpu_count() // 2))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+os.environ.setdefault("PRELOAD_MODELS", "1")
+
+
+def post_fork(server, worker):
+    # Split the CPU between workers instead of every worker using all cores
+    threads = os.getenv("TORCH_NUM_THREADS")
+    if threads:
+        import torch
+        torch.set_num_threads(int(threads))
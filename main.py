@@ -1,14 +1,22 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urlunparse
-import os, re, asyncio
+from fastapi.responses import StreamingResponse
+import os, asyncio, contextlib, fcntl, functools, json, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
 from web_data.web_data import get_all_text_with_metadata
+from web_data.crawler import crawl
 from pydantic import BaseModel
-from typing import List
-from embedding.embedding import build_or_load_vectorstore, retrieve
-from chating.chating import ask_llm
+from embedding.embedding import (
+    VECTOR_DB_PATH,
+    build_or_load_vectorstore,
+    current_version,
+    index_write_lock,
+    update_vectorstore,
+    warm_up_retrieval,
+    preload_models,
+    retrieve,
+)
+from chating.chating import prepare_chat, agenerate_answer, astream_answer, answer_cache
 from dotenv import load_dotenv
 #Old
 # from pdf_data.pdf_data import save_pdfs_to_clean_text, load_and_chunk_pdfs
@@ -19,6 +27,12 @@ from web_data.web_data import get_all_text_with_metadata
 
 load_dotenv()
 
+# Under gunicorn with preload_app (see gunicorn.conf.py) this module is imported
+# once in the master process: load the model weights here so the forked workers
+# share them copy-on-write instead of each loading a private copy.
+if os.getenv("PRELOAD_MODELS", "").strip().lower() in ("1", "true", "yes"):
+    preload_models()
+
 app = FastAPI(title="Functiomed RAG Scraper")
 
 # -------------------------
@@ -41,11 +55,72 @@ os.makedirs(RAW_DIR, exist_ok=True)
 os.makedirs(CLEAN_DIR, exist_ok=True)
 
 # -------------------------
-# URLs to scrape
+# Concurrency limits (per pipeline stage)
 # -------------------------
-BASE_URL = "https://www.functiomed.ch"
-visited = set()
+# Retrieval (query encoding, FAISS, BM25, CrossEncoder) is CPU-bound and runs
+# on its own bounded thread pool; LLM calls are awaited on the event loop.
+# Requests wait up to QUEUE_TIMEOUT_SECONDS for a slot (at most *_MAX_QUEUE of
+# them per stage), anything beyond that gets 429 so slow LLM calls cannot
+# starve retrieval for everyone else.
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+RETRIEVAL_MAX_QUEUE = int(os.getenv("RETRIEVAL_MAX_QUEUE", "32"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("QUEUE_TIMEOUT_SECONDS", "15"))
+
+
+class StageLimiter:
+    """Async context manager bounding one stage's concurrency, with 429 backpressure."""
+
+    def __init__(self, name, limit, max_queue, timeout):
+        self.name = name
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(limit)
+
+    def _busy(self):
+        return HTTPException(
+            status_code=429,
+            detail=f"Server busy ({self.name}), please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+    def check(self):
+        """Raise the 429 right away if a new request could not even queue (reserves nothing)."""
+        if self._sem.locked() and self.waiting >= self.max_queue:
+            raise self._busy()
+
+    async def __aenter__(self):
+        self.check()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._busy()
+        finally:
+            self.waiting -= 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self._sem.release()
+
+
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+retrieval_stage = StageLimiter("retrieval", RETRIEVAL_WORKERS, RETRIEVAL_MAX_QUEUE, QUEUE_TIMEOUT_SECONDS)
+llm_stage = StageLimiter("llm", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, QUEUE_TIMEOUT_SECONDS)
+
+
+async def run_retrieval(fn, *args, **kwargs):
+    """Run CPU-heavy retrieval work on the dedicated pool (429 when saturated)."""
+    async with retrieval_stage:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(retrieval_executor, functools.partial(fn, *args, **kwargs))
 
+
+# -------------------------
+# URLs to scrape
+# -------------------------
 to_visit = {
     # Homepage
     "https://www.functiomed.ch": 0,
@@ -144,97 +219,70 @@ to_visit = {
 MAX_PAGES = len(to_visit)
 
 
-# -------------------------
-# Helper functions
-# -------------------------
-def normalize_url(url):
-    parsed = urlparse(url)
-    url = urlunparse(parsed._replace(fragment=""))
-    if url.endswith("/") and url != BASE_URL + "/":
-        url = url[:-1]
-    return url.lower()
-
-def is_valid_page(url):
-    bad_ext = (".pdf", ".jpg", ".png", ".jpeg", ".svg", ".zip")
-    return not url.lower().endswith(bad_ext) and "undefined" not in url
-
-def skip_dynamic_pages(url):
-    m = re.search(r"news/page/(\d+)", url)
-    return m and int(m.group(1)) > 20
-
-def clean_text(text):
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
-
-def extract_text_from_html(html):
-    soup = BeautifulSoup(html, "lxml")
-    for tag in soup(["script", "style", "nav", "footer", "header", "noscript"]):
-        tag.decompose()
-    main = soup.find("main")
-    content = main.get_text(" ") if main else soup.get_text(" ")
-    return clean_text(content)
-
-
 # -------------------------
 # Startup: auto-load vector store + ingest PDFs
 # -------------------------
 vector_store = None
 
+# Result of the background PDF ingestion started at startup
+startup_pdf_ingest = {"status": "pending", "result": None}
+
+
+def _ingest_pdfs_in_background():
+    # With several workers only one of them converts the PDFs
+    lock_file = open(os.path.join("data", ".pdf_ingest.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        startup_pdf_ingest["status"] = "skipped (running in another worker)"
+        return
+
+    startup_pdf_ingest["status"] = "running"
+    try:
+        # Parses without the lock; writing clean_text/ + the PDF manifest takes
+        # the same lock as /ingest and /ingest_pdfs
+        result = save_pdfs_to_clean_text(write_lock=index_write_lock)
+        startup_pdf_ingest.update(status="done", result=result)
+        if result["saved"]:
+            print(f"📑 {len(result['saved'])} new PDF text file(s) — call POST /ingest to index them")
+    except Exception as e:
+        print(f"❌ Background PDF ingestion failed: {e}")
+        startup_pdf_ingest.update(status="failed", result=str(e))
+    finally:
+        lock_file.close()
+
+
 @app.on_event("startup")
 def startup_event():
     global vector_store
-    # Ensure any PDFs already in pdf_data/files/ are converted to clean_text/
-    print("\n🚀 STARTUP: Ingesting PDFs to clean_text/ ...")
-    save_pdfs_to_clean_text()
-    # Load (or build) the FAISS vector store
-    vector_store = build_or_load_vectorstore()
+    # Convert any new PDFs in pdf_data/files/ to clean_text/ without delaying readiness
+    print("\n🚀 STARTUP: Scheduling PDF ingestion to clean_text/ in the background ...")
+    threading.Thread(target=_ingest_pdfs_in_background, name="pdf-ingest", daemon=True).start()
+    # Load (or build) the FAISS vector store + persisted BM25 / chunk list
+    vector_store = warm_up_retrieval()
     print("🚀 STARTUP complete.\n")
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    retrieval_executor.shutdown(wait=False, cancel_futures=True)
+
+
 # -------------------------
 # Scrape Endpoint
 # -------------------------
 @app.get("/scrape")
-async def scrape_site():
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
-        scraped_count = 0
-
-        while to_visit:
-            url, _ = to_visit.popitem()
-            url = normalize_url(url)
-            if url in visited or skip_dynamic_pages(url) or not is_valid_page(url):
-                continue
-            visited.add(url)
-
-            print(f"Scraping ({scraped_count + 1}): {url}")
-
-            try:
-                await page.goto(url, timeout=30000)
-                await page.wait_for_load_state("networkidle")
-                html = await page.content()
-
-                # Save raw HTML
-                filename = url.replace("https://", "").replace("/", "_") + ".html"
-                with open(os.path.join(RAW_DIR, filename), "w", encoding="utf-8") as f:
-                    f.write(html)
-
-                # Save clean text
-                text = extract_text_from_html(html)
-                out_file = filename.replace(".html", ".txt")
-                with open(os.path.join(CLEAN_DIR, out_file), "w", encoding="utf-8") as f:
-                    f.write(text)
-
-                scraped_count += 1
-
-            except Exception as e:
-                print(f"Failed {url}: {e}")
-
-        await browser.close()
-        print(f"Scraping completed. Total pages: {scraped_count}")
-
-    return {"status": "completed", "pages_scraped": scraped_count}
+async def scrape_site(force: bool = False):
+    """
+    Re-scrape every URL in `to_visit` with a pool of parallel browser pages
+    (see web_data/crawler.py) into RAW_DIR / CLEAN_DIR.
+    Unchanged pages (304 / same text hash) are skipped; `changed_files` lists
+    the clean_text files that were actually rewritten, so a following /ingest
+    only re-embeds those. Pass ?force=true to ignore the crawl state.
+    Returns per-URL timing stats.
+    """
+    return await crawl(to_visit, RAW_DIR, CLEAN_DIR, force=force)
 
 
 # -------------------------
@@ -246,29 +294,161 @@ def ingest_pdfs():
     Parse all PDFs in pdf_data/files/ → save as .txt in data/clean_text/.
     Call this whenever you add new PDF files.
     After this, call /ingest to rebuild the FAISS index.
+    PDFs are parsed without holding the index write lock; only writing the
+    text files and the PDF manifest waits for index builds and for
+    conversions running in other workers.
     """
-    result = save_pdfs_to_clean_text()
+    result = save_pdfs_to_clean_text(write_lock=index_write_lock)
     return {
         "message": "PDF ingestion complete",
         "saved":   result["saved"],
         "skipped": result["skipped"],
         "failed":  result["failed"],
+        "removed": result["removed"],
+        "duplicates": result["duplicates"],
     }
 
 
+@app.get("/ingest_pdfs/status")
+def ingest_pdfs_status():
+    """Status of the PDF ingestion scheduled at startup."""
+    return startup_pdf_ingest
+
+
 # -------------------------
 # Ingest (rebuild FAISS) endpoint
 # -------------------------
-@app.post("/ingest")
-def ingest_data():
+# Background index jobs, one JSON record per job under INDEX_JOBS_DIR so every
+# worker sees them (a status poll may reach another worker than the POST). The
+# old index keeps serving while a job builds the new version in its own
+# directory; it is swapped in atomically (CURRENT pointer + in-memory store)
+# once complete.
+INDEX_JOBS_DIR = os.path.join(VECTOR_DB_PATH, "jobs")
+MAX_INDEX_JOBS = 20
+
+
+@contextlib.contextmanager
+def _index_jobs_lock():
     """
-    Rebuild the FAISS index from all files in data/clean_text/
-    (web pages + PDF-derived .txt files).
+    Cross-worker lock for creating job records. Not the index write lock: a
+    running job holds that for the whole build, and a POST must not wait on it.
+    """
+    os.makedirs(INDEX_JOBS_DIR, exist_ok=True)
+    with open(os.path.join(INDEX_JOBS_DIR, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(INDEX_JOBS_DIR, f"{job_id}.json")
+
+
+def _write_job(job_id: str, job: dict):
+    tmp = _job_path(job_id) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+    os.replace(tmp, _job_path(job_id))
+
+
+def _update_job(job_id: str, **fields):
+    # Only the thread running the job writes its record after creation
+    job = _read_job(job_id)
+    job.update(fields)
+    _write_job(job_id, job)
+
+
+def _read_job(job_id: str):
+    """The job record, or None if unknown. An unfinished job whose worker is gone is reported as failed."""
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_job_path(job_id), "r", encoding="utf-8") as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if job["status"] in ("queued", "running") and not _pid_alive(job.get("worker_pid")):
+        job.update(status="failed", error="worker exited before the job finished")
+    return job
+
+
+def _pid_alive(pid) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _list_jobs() -> list:
+    """[(job id, record), ...] oldest first."""
+    if not os.path.isdir(INDEX_JOBS_DIR):
+        return []
+    jobs = []
+    for name in os.listdir(INDEX_JOBS_DIR):
+        if name.endswith(".json"):
+            job = _read_job(name[:-len(".json")])
+            if job is not None:
+                jobs.append((name[:-len(".json")], job))
+    return sorted(jobs, key=lambda item: item[1]["created_at"])
+
+
+def _run_index_job(job_id: str, full: bool):
+    _update_job(job_id, status="running", started_at=time.time())
+    try:
+        if full:
+            store = build_or_load_vectorstore(force_rebuild=True)
+            result = {"mode": "full", "total_chunks": store.index.ntotal}
+        else:
+            result = update_vectorstore()
+        # Cached answers were generated from the old index
+        answer_cache.clear()
+        _update_job(job_id, status="done", result=result, index_version=current_version(), finished_at=time.time())
+    except Exception as e:
+        print(f"❌ Index job {job_id} failed: {e}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+
+
+@app.post("/ingest", status_code=202)
+def ingest_data(full: bool = False):
+    """
+    Sync the FAISS index with all files in data/clean_text/
+    (web pages + PDF-derived .txt files) in the background.
+    Only added / changed / deleted files are re-embedded; pass ?full=true
+    to force a complete rebuild.
     Run /ingest_pdfs first if you have new PDFs to add.
+
+    Returns a job id to poll at GET /ingest/{job_id}. The current index keeps
+    answering queries until the new version is published; other workers
+    switch to it on their next query (see INDEX_CHECK_SECONDS). If a job is
+    already queued or running in any worker, its id is returned instead of
+    starting another.
     """
-    global vector_store
-    vector_store = build_or_load_vectorstore(force_rebuild=True)
-    return {"message": "Vector store rebuilt successfully from web + PDF data"}
+    with _index_jobs_lock():
+        jobs = _list_jobs()
+        for job_id, job in jobs:
+            if job["status"] in ("queued", "running"):
+                return {"message": "Index job already in progress", "job_id": job_id, **job}
+
+        job_id = uuid.uuid4().hex[:12]
+        _write_job(job_id, {"status": "queued", "full": full, "created_at": time.time(), "worker_pid": os.getpid()})
+        for old_id, _ in jobs[:-(MAX_INDEX_JOBS - 1) or None]:
+            os.remove(_job_path(old_id))
+
+    threading.Thread(target=_run_index_job, args=(job_id, full), name=f"index-{job_id}", daemon=True).start()
+    return {"message": "Index job started", "job_id": job_id, "status": "queued"}
+
+
+@app.get("/ingest/{job_id}")
+def ingest_status(job_id: str):
+    """Status of a background index job (queued / running / done / failed)."""
+    job = _read_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown index job {job_id}")
+    return {"job_id": job_id, "serving_version": current_version(), **job}
 
 
 # -------------------------
@@ -309,17 +489,19 @@ class QueryRequest(BaseModel):
     k: int = 10
 
 @app.post("/retrieve")
-def retrieve_text(request: QueryRequest):
+async def retrieve_text(request: QueryRequest):
     global vector_store
     if vector_store is None:
-        vector_store = build_or_load_vectorstore()
-    results = retrieve(request.query, top_n=request.k)
+        vector_store = await run_retrieval(build_or_load_vectorstore)
+    timings = {}
+    results = await run_retrieval(retrieve, request.query, top_n=request.k, timings=timings)
     return {
         "query": request.query,
         "results": [
             {"content": doc.page_content, "metadata": doc.metadata}
             for doc in results
         ],
+        "debug": {"timings_ms": timings},
     }
 
 
@@ -330,11 +512,18 @@ class ChatQueryRequest(BaseModel):
     query: str
 
 @app.post("/chat")
-def chat(request: ChatQueryRequest):
+async def chat(request: ChatQueryRequest):
     try:
-        answer = ask_llm(request.query)
+        prepared = await run_retrieval(prepare_chat, request.query)
+        if prepared["answer"] is None:
+            async with llm_stage:
+                answer = await agenerate_answer(prepared)
+        else:
+            answer = prepared["answer"]
         print(f"Answer: {answer}")
         return {"query": request.query, "answer": answer}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Chat error: {e}")
         import traceback
@@ -344,3 +533,70 @@ def chat(request: ChatQueryRequest):
             "answer": f"I'm sorry, something went wrong on the server. Please try again. (Error: {str(e)})",
         }
 
+
+# -------------------------
+# Streaming chat endpoint (Server-Sent Events)
+# -------------------------
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _event_stream(events):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _stream_error(e):
+    print(f"Chat stream error: {e}")
+    return _sse("error", {"detail": f"I'm sorry, something went wrong on the server. Please try again. (Error: {str(e)})"})
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatQueryRequest):
+    """
+    Same as /chat, but streamed as SSE:
+      event: sources → retrieved sources (sent before generation starts)
+      event: token   → answer text as it arrives
+      event: error   → retrieval or generation failed
+      event: done    → end of stream
+    Only "server busy" is a plain 429 response.
+    """
+    try:
+        prepared = await run_retrieval(prepare_chat, request.query)
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Same failures /chat answers with a message
+        error = _stream_error(e)
+
+        async def failed():
+            yield error
+            yield _sse("done", {})
+
+        return _event_stream(failed())
+
+    needs_llm = prepared["answer"] is None
+    if needs_llm:
+        # Obvious overload is still a plain 429; the slot itself is taken inside
+        # the stream so it is released even if the body is never sent
+        llm_stage.check()
+
+    async def events():
+        try:
+            yield _sse("sources", prepared["sources"])
+            parts = []
+            async with (llm_stage if needs_llm else contextlib.nullcontext()):
+                async for text in astream_answer(prepared):
+                    parts.append(text)
+                    yield _sse("token", {"text": text})
+            print(f"Answer (stream): {''.join(parts)}")
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail})
+        except Exception as e:
+            yield _stream_error(e)
+        yield _sse("done", {})
+
+    return _event_stream(events())
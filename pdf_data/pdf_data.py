@@ -1,6 +1,12 @@
 import os
 import re
-from typing import Dict
+import contextlib
+import json
+import time
+import hashlib
+import signal
+import multiprocessing
+from typing import Dict, List
 from langchain_community.document_loaders import PyPDFLoader
 
 # ─────────────────────────────────────────────────────────────
@@ -10,9 +16,18 @@ from langchain_community.document_loaders import PyPDFLoader
 PDF_DIR = "pdf_data/files"
 CLEAN_DIR = "data/clean_text"
 
+# Content hash (+ size/mtime fast path) of every PDF and the clean_text
+# files generated from them
+PDF_MANIFEST_PATH = "data/pdf_manifest.json"
+
 # Prefix for PDF-derived text files
 PDF_FILE_PREFIX = "pdf__"
 
+# PDFs are parsed in a process pool; one pathological file is aborted after
+# PDF_TIMEOUT_SECONDS instead of hanging the whole batch.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_TIMEOUT_SECONDS = int(os.getenv("PDF_TIMEOUT_SECONDS", "120"))
+
 
 # ─────────────────────────────────────────────────────────────
 # Internal helpers
@@ -33,86 +48,290 @@ def _pdf_name_to_txt(pdf_filename: str) -> str:
     return f"{PDF_FILE_PREFIX}{base}.txt"
 
 
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _load_manifest() -> Dict:
+    try:
+        with open(PDF_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.setdefault("files", {})
+    manifest.setdefault("texts", {})
+    return manifest
+
+
+def _save_manifest(manifest: Dict):
+    os.makedirs(os.path.dirname(PDF_MANIFEST_PATH) or ".", exist_ok=True)
+    tmp = PDF_MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, PDF_MANIFEST_PATH)
+
+
+def _fingerprint_pdf(pdf_filename: str, known: Dict) -> Dict:
+    """sha256/size/mtime of a PDF; the hash is reused when size + mtime are unchanged."""
+    st = os.stat(os.path.join(PDF_DIR, pdf_filename))
+    if known and known.get("size") == st.st_size and known.get("mtime_ns") == st.st_mtime_ns:
+        digest = known["sha256"]
+    else:
+        digest = _hash_file(os.path.join(PDF_DIR, pdf_filename))
+    return {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _canonical_name(pdf_filenames: List[str]) -> str:
+    """Of byte-identical copies keep the shortest name ('X.pdf' over 'Copy of Copy of X.pdf')."""
+    return min(pdf_filenames, key=lambda f: (len(f), f))
+
+
+def _on_timeout(signum, frame):
+    raise TimeoutError(f"parsing took longer than {PDF_TIMEOUT_SECONDS}s")
+
+
+def _parse_pdf(pdf_path: str) -> str:
+    """
+    Extract the cleaned text of one PDF (runs in a worker process).
+    Enforces PDF_TIMEOUT_SECONDS with SIGALRM where available.
+    """
+    use_alarm = hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.alarm(PDF_TIMEOUT_SECONDS)
+    try:
+        loader = PyPDFLoader(pdf_path)
+        pages = loader.load()
+        return "\n\n".join(
+            _clean_text(page.page_content)
+            for page in pages
+            if page.page_content and page.page_content.strip()
+        )
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+
+def _parse_in_pool(pdf_filenames: List[str]) -> Dict[str, object]:
+    """
+    Parse PDFs in a process pool. Returns {pdf_filename: text or Exception}.
+    """
+    results: Dict[str, object] = {}
+    n_workers = max(1, min(PDF_WORKERS, len(pdf_filenames)))
+    print(f"  ⚙️  Parsing {len(pdf_filenames)} PDF(s) with {n_workers} worker process(es)")
+
+    # "spawn": the server process may already hold model threads, which
+    # do not survive fork() safely
+    pool = multiprocessing.get_context("spawn").Pool(n_workers)
+    jobs = {
+        f: pool.apply_async(_parse_pdf, (os.path.join(PDF_DIR, f),))
+        for f in pdf_filenames
+    }
+    # Backstop if a worker ignores SIGALRM (e.g. stuck in C code / Windows):
+    # every batch of n_workers files gets at most PDF_TIMEOUT_SECONDS (+ slack)
+    rounds = -(-len(pdf_filenames) // n_workers)
+    deadline = time.monotonic() + rounds * PDF_TIMEOUT_SECONDS + 30
+    timed_out = False
+
+    for pdf_filename, job in jobs.items():
+        try:
+            results[pdf_filename] = job.get(timeout=max(0.0, deadline - time.monotonic()))
+        except multiprocessing.TimeoutError:
+            timed_out = True
+            results[pdf_filename] = TimeoutError("timed out")
+        except Exception as e:
+            results[pdf_filename] = e
+
+    if timed_out:
+        pool.terminate()
+    else:
+        pool.close()
+    pool.join()
+    return results
+
+
 # ─────────────────────────────────────────────────────────────
 # Public API
 # ─────────────────────────────────────────────────────────────
 
-def save_pdfs_to_clean_text() -> Dict[str, list]:
+def _plan(pdf_files: List[str], manifest: Dict, known_files: Dict) -> Dict:
+    """
+    Fingerprint every PDF, group byte-identical copies and split the groups
+    into up-to-date clean_text files and canonical PDFs that need parsing.
+    """
+    files = {
+        f: _fingerprint_pdf(f, manifest["files"].get(f) or known_files.get(f))
+        for f in pdf_files
+    }
+    groups: Dict[str, List[str]] = {}
+    for f, info in files.items():
+        groups.setdefault(info["sha256"], []).append(f)
+
+    old_texts = manifest["texts"]
+    up_to_date: Dict[str, Dict] = {}
+    duplicates: Dict[str, List[str]] = {}
+    to_parse = []
+    for digest, names in groups.items():
+        canonical = _canonical_name(names)
+        txt_filename = _pdf_name_to_txt(canonical)
+        if len(names) > 1:
+            duplicates[txt_filename] = sorted(n for n in names if n != canonical)
+
+        known = old_texts.get(txt_filename)
+        if (
+            known is not None
+            and known["sha256"] == digest
+            and (known.get("empty") or os.path.exists(os.path.join(CLEAN_DIR, txt_filename)))
+        ):
+            up_to_date[txt_filename] = {**known, "pdfs": sorted(names)}
+        else:
+            to_parse.append(canonical)
+
+    return {"files": files, "groups": groups, "up_to_date": up_to_date, "duplicates": duplicates, "to_parse": to_parse}
+
+
+def save_pdfs_to_clean_text(write_lock=None) -> Dict[str, list]:
     """
     Parse all PDFs from PDF_DIR, clean text, and save into CLEAN_DIR.
 
+    Change detection is by content hash (data/pdf_manifest.json), not by
+    file existence:
+      • new or changed PDFs are (re-)parsed
+      • byte-identical copies share ONE clean_text file (shortest name wins)
+      • clean_text files of removed PDFs / redundant copies are deleted
+
+    Parsing runs without `write_lock` (a context manager factory, e.g. the
+    index write lock); only comparing against the manifest and writing
+    CLEAN_DIR + the manifest happen under it. PDFs that another writer changed
+    in between are parsed under the lock.
+
     Chunking is intentionally NOT done here.
 
     Returns:
     {
-        "saved":   [...],
-        "skipped": [...],
-        "failed":  [...]
+        "saved":      [...],
+        "skipped":    [...],
+        "failed":     [...],
+        "removed":    [...],   # deleted clean_text files
+        "duplicates": {...}    # canonical txt → identical PDF copies
     }
     """
     os.makedirs(CLEAN_DIR, exist_ok=True)
 
-    saved, skipped, failed = [], [], []
-
-    pdf_files = [
+    pdf_files = sorted(
         f for f in os.listdir(PDF_DIR)
         if f.lower().endswith(".pdf")
-    ]
+    )
 
-    if not pdf_files:
+    manifest = _load_manifest()
+    if not pdf_files and not manifest["texts"]:
         print(f"⚠️  No PDFs found in '{PDF_DIR}'")
-        return {"saved": [], "skipped": [], "failed": []}
+        return {"saved": [], "skipped": [], "failed": [], "removed": [], "duplicates": {}}
 
     print(f"\n📑 Processing {len(pdf_files)} PDF(s)")
     print("=" * 60)
 
-    for pdf_filename in pdf_files:
-        txt_filename = _pdf_name_to_txt(pdf_filename)
-        txt_path = os.path.join(CLEAN_DIR, txt_filename)
-        pdf_path = os.path.join(PDF_DIR, pdf_filename)
+    # Slow part first, without the lock: (pdf filename, sha256) → text or Exception
+    plan = _plan(pdf_files, manifest, {})
+    parsed = {}
+    if plan["to_parse"]:
+        for pdf_filename, result in _parse_in_pool(plan["to_parse"]).items():
+            parsed[(pdf_filename, plan["files"][pdf_filename]["sha256"])] = result
 
-        # Skip if already processed (idempotent)
-        if os.path.exists(txt_path):
-            print(f"  ⏭️  Skip (exists): {txt_filename}")
-            skipped.append(txt_filename)
-            continue
+    with (write_lock() if write_lock else contextlib.nullcontext()):
+        return _apply(pdf_files, plan["files"], parsed)
 
-        try:
-            loader = PyPDFLoader(pdf_path)
-            pages = loader.load()
 
-            full_text = "\n\n".join(
-                _clean_text(page.page_content)
-                for page in pages
-                if page.page_content and page.page_content.strip()
-            )
+def _apply(pdf_files: List[str], known_files: Dict, parsed: Dict) -> Dict[str, list]:
+    """Compare against the current manifest and write CLEAN_DIR + the manifest (caller holds the lock)."""
+    saved, skipped, failed, removed = [], [], [], []
 
-            if not full_text:
-                print(f"  ⚠️  Empty content: {pdf_filename}")
-                skipped.append(txt_filename)
-                continue
+    manifest = _load_manifest()
+    old_texts = manifest["texts"]
+    plan = _plan(pdf_files, manifest, known_files)
+    files, groups, duplicates = plan["files"], plan["groups"], plan["duplicates"]
 
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(full_text)
+    texts: Dict[str, Dict] = {}
+    for txt_filename, known in plan["up_to_date"].items():
+        print(f"  ⏭️  Skip (unchanged): {txt_filename}")
+        skipped.append(txt_filename)
+        texts[txt_filename] = known
 
-            print(f"  ✅ Saved: {txt_filename} ({len(full_text):,} chars)")
-            saved.append(txt_filename)
+    missing = [f for f in plan["to_parse"] if (f, files[f]["sha256"]) not in parsed]
+    if missing:
+        # Changed by another writer since the unlocked parse
+        for pdf_filename, result in _parse_in_pool(missing).items():
+            parsed[(pdf_filename, files[pdf_filename]["sha256"])] = result
 
-        except Exception as e:
-            msg = f"{pdf_filename}: {e}"
+    for pdf_filename in plan["to_parse"]:
+        txt_filename = _pdf_name_to_txt(pdf_filename)
+        digest = files[pdf_filename]["sha256"]
+        names = sorted(groups[digest])
+        result = parsed[(pdf_filename, digest)]
+
+        if isinstance(result, Exception):
+            msg = f"{pdf_filename}: {result}"
             print(f"  ❌ Failed: {msg}")
             failed.append(msg)
+            # Keep whatever text we had, but retry next time
+            if txt_filename in old_texts:
+                texts[txt_filename] = {**old_texts[txt_filename], "sha256": None, "pdfs": names}
+            continue
+
+        if not result:
+            print(f"  ⚠️  Empty content: {pdf_filename}")
+            skipped.append(txt_filename)
+            texts[txt_filename] = {"sha256": digest, "pdfs": names, "empty": True}
+            # The PDF changed: its previous text must not stay indexed
+            path = os.path.join(CLEAN_DIR, txt_filename)
+            if txt_filename in old_texts and os.path.exists(path):
+                os.remove(path)
+                print(f"  🗑️  Removed: {txt_filename}")
+                removed.append(txt_filename)
+            continue
+
+        with open(os.path.join(CLEAN_DIR, txt_filename), "w", encoding="utf-8") as f:
+            f.write(result)
+
+        print(f"  ✅ Saved: {txt_filename} ({len(result):,} chars)")
+        saved.append(txt_filename)
+        texts[txt_filename] = {"sha256": digest, "pdfs": names}
+
+    # Clean text that no longer belongs to a (canonical) PDF: files we generated
+    # for since-removed PDFs, and legacy per-copy files of identical PDFs
+    stale = set(old_texts) - set(texts)
+    stale.update(
+        _pdf_name_to_txt(n)
+        for copies in duplicates.values()
+        for n in copies
+    )
+    for txt_filename in sorted(stale - set(texts)):
+        path = os.path.join(CLEAN_DIR, txt_filename)
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"  🗑️  Removed: {txt_filename}")
+            removed.append(txt_filename)
+
+    manifest = {"files": files, "texts": texts}
+    _save_manifest(manifest)
 
     print("=" * 60)
     print(
         f"Done — saved: {len(saved)}, "
         f"skipped: {len(skipped)}, "
-        f"failed: {len(failed)}\n"
+        f"failed: {len(failed)}, "
+        f"removed: {len(removed)}, "
+        f"duplicates: {sum(len(v) for v in duplicates.values())}\n"
     )
 
     return {
         "saved": saved,
         "skipped": skipped,
         "failed": failed,
+        "removed": removed,
+        "duplicates": duplicates,
     }
-
@@ -0,0 +1,408 @@
+import os
+import re
+import time
+import json
+import asyncio
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, List
+from urllib.parse import urlparse, urlunparse
+
+import httpx
+from bs4 import BeautifulSoup
+from playwright.async_api import async_playwright
+
+# ─────────────────────────────────────────────────────────────
+# Config
+# ─────────────────────────────────────────────────────────────
+
+BASE_URL = "https://www.functiomed.ch"
+
+# Number of URLs fetched in parallel, and max browser pages for JS-heavy pages
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))
+BROWSER_POOL_SIZE = int(os.getenv("CRAWL_BROWSER_PAGES", str(CRAWL_CONCURRENCY)))
+
+# Pages are first fetched with plain HTTP; if the <main> text is missing or
+# shorter than this, the page is rendered with headless Chromium instead.
+MIN_STATIC_TEXT_CHARS = int(os.getenv("CRAWL_MIN_STATIC_TEXT_CHARS", "200"))
+
+USER_AGENT = "Mozilla/5.0 (compatible; functiomed-rag-crawler/1.0)"
+
+# Politeness per host: max parallel requests + min gap between request starts
+PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", "2"))
+PER_HOST_MIN_INTERVAL = float(os.getenv("CRAWL_PER_HOST_MIN_INTERVAL", "0.25"))
+
+# Retries with exponential backoff (CRAWL_BACKOFF_SECONDS, 2x, 4x, ...)
+CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", "2"))
+CRAWL_BACKOFF_SECONDS = float(os.getenv("CRAWL_BACKOFF_SECONDS", "1.0"))
+
+PAGE_TIMEOUT_MS = 30000
+
+# Persistent per-URL crawl state: ETag / Last-Modified validators, clean text
+# hash and timestamps. Used to skip pages that did not change.
+CRAWL_STATE_PATH = "data/crawl_state.json"
+
+
+# ─────────────────────────────────────────────────────────────
+# Helper functions
+# ─────────────────────────────────────────────────────────────
+
+def normalize_url(url):
+    parsed = urlparse(url)
+    url = urlunparse(parsed._replace(fragment=""))
+    if url.endswith("/") and url != BASE_URL + "/":
+        url = url[:-1]
+    return url.lower()
+
+def is_valid_page(url):
+    bad_ext = (".pdf", ".jpg", ".png", ".jpeg", ".svg", ".zip")
+    return not url.lower().endswith(bad_ext) and "undefined" not in url
+
+def skip_dynamic_pages(url):
+    m = re.search(r"news/page/(\d+)", url)
+    return m and int(m.group(1)) > 20
+
+def clean_text(text):
+    text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+def _parse_text(html):
+    """Return (clean text, whether the page has a <main> element)."""
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(["script", "style", "nav", "footer", "header", "noscript"]):
+        tag.decompose()
+    main = soup.find("main")
+    content = main.get_text(" ") if main else soup.get_text(" ")
+    return clean_text(content), main is not None
+
+def extract_text_from_html(html):
+    return _parse_text(html)[0]
+
+def url_to_filename(url):
+    """'https://www.functiomed.ch/kontakt' → 'www.functiomed.ch_kontakt' (no extension)."""
+    return url.replace("https://", "").replace("/", "_")
+
+
+class HostLimiter:
+    """Per-host concurrency cap + minimum interval between request starts."""
+
+    def __init__(self, concurrency: int, min_interval: float):
+        self.min_interval = min_interval
+        self._sems = defaultdict(lambda: asyncio.Semaphore(concurrency))
+        self._locks = defaultdict(asyncio.Lock)
+        self._last_start = defaultdict(float)
+
+    def slot(self, host: str):
+        limiter = self
+
+        class _Slot:
+            async def __aenter__(self):
+                await limiter._sems[host].acquire()
+                async with limiter._locks[host]:
+                    wait = limiter._last_start[host] + limiter.min_interval - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    limiter._last_start[host] = time.monotonic()
+
+            async def __aexit__(self, *exc):
+                limiter._sems[host].release()
+
+        return _Slot()
+
+
+# ─────────────────────────────────────────────────────────────
+# Crawl state
+# ─────────────────────────────────────────────────────────────
+
+def load_crawl_state(path: str = CRAWL_STATE_PATH) -> Dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_crawl_state(state: Dict, path: str = CRAWL_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _conditional_headers(known: Dict) -> Dict:
+    headers = {}
+    if known.get("etag"):
+        headers["If-None-Match"] = known["etag"]
+    if known.get("last_modified"):
+        headers["If-Modified-Since"] = known["last_modified"]
+    return headers
+
+
+# ─────────────────────────────────────────────────────────────
+# Crawler
+# ─────────────────────────────────────────────────────────────
+
+class BrowserPool:
+    """
+    Headless Chromium, launched on first use, with up to `size` reusable
+    pages (one browser context each). Static pages never start a browser.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._playwright = None
+        self._browser = None
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._created = 0
+        self._lock = asyncio.Lock()
+
+    async def _acquire(self):
+        async with self._lock:
+            if self._browser is None:
+                print("  🌐 Launching headless Chromium for JS-rendered pages")
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+            if self._idle.empty() and self._created < self.size:
+                self._created += 1
+                context = await self._browser.new_context()
+                return await context.new_page()
+        return await self._idle.get()
+
+    async def render(self, url: str):
+        """Load `url` and return (html, main response headers)."""
+        page = await self._acquire()
+        try:
+            response = await page.goto(url, timeout=PAGE_TIMEOUT_MS)
+            await page.wait_for_load_state("networkidle")
+            html = await page.content()
+        except Exception:
+            # The page may be unusable after a crash/timeout — start fresh
+            try:
+                context = page.context
+                await page.close()
+                page = await context.new_page()
+            except Exception:
+                pass
+            self._idle.put_nowait(page)
+            raise
+        self._idle.put_nowait(page)
+        headers = response.headers if response is not None else {}
+        return html, headers
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            await self._playwright.stop()
+
+
+def _save_page(url: str, html: str, text: str, raw_dir: str, clean_dir: str, known: Dict, force: bool):
+    """
+    Write raw HTML + clean text for `url` unless the clean text is unchanged.
+    Returns (clean text filename, content hash, changed).
+    """
+    filename = url_to_filename(url)
+    txt_path = os.path.join(clean_dir, filename + ".txt")
+
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    changed = force or content_hash != known.get("content_hash") or not os.path.exists(txt_path)
+
+    if changed:
+        with open(os.path.join(raw_dir, filename + ".html"), "w", encoding="utf-8") as f:
+            f.write(html)
+        with open(txt_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return filename + ".txt", content_hash, changed
+
+
+async def _fetch(url: str, known: Dict, conditional: Dict, client, browsers: BrowserPool) -> Dict:
+    """
+    Fetch one page with the strategy that worked last time ("http" by default).
+
+    "http": conditional GET; falls back to the browser if the <main> text is
+    missing or shorter than MIN_STATIC_TEXT_CHARS.
+    "browser": conditional HEAD, then full Chromium render.
+
+    Returns {"result": "not_modified"} or {"result": "fetched", html, text, headers, strategy}.
+    """
+    if known.get("strategy", "http") == "http":
+        response = await client.get(url, headers=conditional)
+        if response.status_code == 304:
+            return {"result": "not_modified", "strategy": "http"}
+        if response.status_code >= 400:
+            # e.g. bot protection — a real browser may still get through
+            print(f"  🌐 {url}: HTTP {response.status_code} — rendering in browser")
+        else:
+            # HTML parsing is CPU-bound: keep it off the event loop shared with /chat
+            text, has_main = await asyncio.to_thread(_parse_text, response.text)
+            if has_main and len(text) >= MIN_STATIC_TEXT_CHARS:
+                return {
+                    "result": "fetched",
+                    "html": response.text,
+                    "text": text,
+                    "headers": response.headers,
+                    "strategy": "http",
+                }
+            print(f"  🌐 {url}: static <main> text too short ({len(text)} chars) — rendering in browser")
+    elif conditional:
+        response = await client.head(url, headers=conditional)
+        if response.status_code == 304:
+            return {"result": "not_modified", "strategy": "browser"}
+
+    html, headers = await browsers.render(url)
+    return {
+        "result": "fetched",
+        "html": html,
+        "text": await asyncio.to_thread(extract_text_from_html, html),
+        "headers": headers,
+        "strategy": "browser",
+    }
+
+
+async def _worker(worker_id, queue, client, browsers, hosts, raw_dir, clean_dir, state, force, stats):
+    while True:
+        url = await queue.get()
+        started = time.perf_counter()
+        entry = {"url": url, "status": "failed", "attempts": 0}
+        known = {} if force else state.get(url, {})
+        txt_exists = os.path.exists(os.path.join(clean_dir, url_to_filename(url) + ".txt"))
+        conditional = _conditional_headers(known) if txt_exists else {}
+        try:
+            for attempt in range(CRAWL_RETRIES + 1):
+                entry["attempts"] = attempt + 1
+                try:
+                    async with hosts.slot(urlparse(url).netloc):
+                        fetched = await _fetch(url, known, conditional, client, browsers)
+
+                    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+                    entry["strategy"] = fetched["strategy"]
+                    if fetched["result"] == "not_modified":
+                        entry["status"] = "not_modified"
+                        state[url] = {**known, "last_checked": now}
+                        print(f"  ⏭️  [{worker_id}] {url} (304 not modified)")
+                    else:
+                        filename, content_hash, changed = await asyncio.to_thread(
+                            _save_page, url, fetched["html"], fetched["text"], raw_dir, clean_dir, known, force,
+                        )
+                        entry["status"] = "changed" if changed else "unchanged"
+                        entry["file"] = filename
+                        entry["chars"] = len(fetched["text"])
+                        state[url] = {
+                            "etag": fetched["headers"].get("etag"),
+                            "last_modified": fetched["headers"].get("last-modified"),
+                            "content_hash": content_hash,
+                            "file": filename,
+                            "strategy": fetched["strategy"],
+                            "last_checked": now,
+                            "last_scraped": now,
+                            "last_changed": now if changed else known.get("last_changed"),
+                        }
+                        icon = "✅" if changed else "⏭️ "
+                        print(
+                            f"  {icon} [{worker_id}] {url} "
+                            f"({entry['status']}, {fetched['strategy']}, {entry['chars']:,} chars)"
+                        )
+                    entry.pop("error", None)
+                    break
+                except Exception as e:
+                    entry["error"] = str(e)
+                    print(f"  ⚠️  [{worker_id}] Attempt {attempt + 1} failed for {url}: {e}")
+                    if attempt < CRAWL_RETRIES:
+                        await asyncio.sleep(CRAWL_BACKOFF_SECONDS * (2 ** attempt))
+        finally:
+            entry["seconds"] = round(time.perf_counter() - started, 3)
+            stats.append(entry)
+            queue.task_done()
+
+
+async def crawl(
+    urls: Iterable[str],
+    raw_dir: str,
+    clean_dir: str,
+    force: bool = False,
+    state_path: str = CRAWL_STATE_PATH,
+) -> Dict:
+    """
+    Scrape `urls` with CRAWL_CONCURRENCY workers pulling from a shared work
+    queue. Writes <raw_dir>/<name>.html and <clean_dir>/<name>.txt for every
+    changed page and returns per-URL timing stats.
+
+    Each page is fetched with a pooled HTTP client first; only pages whose
+    <main> text is missing/too short are rendered in headless Chromium, and
+    the strategy that worked is remembered for the next crawl.
+    Pages are skipped when a conditional request (stored ETag /
+    Last-Modified) returns 304, and files are only rewritten when the clean
+    text hash changed. `force=True` ignores the stored crawl state.
+    """
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(clean_dir, exist_ok=True)
+
+    targets: List[str] = []
+    seen = set()
+    for url in urls:
+        url = normalize_url(url)
+        if url in seen or skip_dynamic_pages(url) or not is_valid_page(url):
+            continue
+        seen.add(url)
+        targets.append(url)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for url in targets:
+        queue.put_nowait(url)
+
+    stats: List[Dict] = []
+    state = await asyncio.to_thread(load_crawl_state, state_path)
+    hosts = HostLimiter(PER_HOST_CONCURRENCY, PER_HOST_MIN_INTERVAL)
+    browsers = BrowserPool(BROWSER_POOL_SIZE)
+    n_workers = max(1, min(CRAWL_CONCURRENCY, len(targets)))
+    started = time.perf_counter()
+
+    print(f"\n🕷️  Crawling {len(targets)} URLs with {n_workers} workers")
+    print("=" * 60)
+
+    client = httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=PAGE_TIMEOUT_MS / 1000,
+        headers={"User-Agent": USER_AGENT},
+        limits=httpx.Limits(max_connections=n_workers, max_keepalive_connections=n_workers),
+    )
+    workers = [
+        asyncio.create_task(
+            _worker(i, queue, client, browsers, hosts, raw_dir, clean_dir, state, force, stats)
+        )
+        for i in range(n_workers)
+    ]
+    try:
+        await queue.join()
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await client.aclose()
+        await browsers.close()
+        await asyncio.to_thread(save_crawl_state, state, state_path)
+
+    elapsed = time.perf_counter() - started
+    changed = sorted(s["file"] for s in stats if s["status"] == "changed")
+    unchanged = [s for s in stats if s["status"] == "unchanged"]
+    not_modified = [s for s in stats if s["status"] == "not_modified"]
+    failed = [s for s in stats if s["status"] == "failed"]
+    browser_pages = [s for s in stats if s.get("strategy") == "browser"]
+
+    print("=" * 60)
+    print(
+        f"Scraping completed. Changed: {len(changed)}  |  unchanged: {len(unchanged)}  |  "
+        f"304: {len(not_modified)}  |  failed: {len(failed)}  |  "
+        f"browser: {len(browser_pages)}  |  {elapsed:.1f}s\n"
+    )
+
+    return {
+        "status": "completed",
+        "pages_scraped": len(changed) + len(unchanged),
+        "pages_not_modified": len(not_modified),
+        "pages_failed": len(failed),
+        "pages_rendered_in_browser": len(browser_pages),
+        "changed_files": changed,
+        "elapsed_seconds": round(elapsed, 2),
+        "stats": sorted(stats, key=lambda s: s["url"]),
+    }
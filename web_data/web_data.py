@@ -109,7 +109,7 @@
 # --------------------------------- New -----------------------
 
 import os
-from typing import List
+from typing import Iterable, List, Optional
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
@@ -122,14 +122,28 @@ CLEAN_DIR = "data/clean_text"
 # Must match pdf_data.py
 PDF_FILE_PREFIX = "pdf__"
 
+# Chunking defaults (the FAISS manifest records these, so changing them
+# forces a full index rebuild on the next /ingest)
+CHUNK_SIZE = 400        # Reduced from 1000 for better granularity
+CHUNK_OVERLAP = 200     # Reduced from 200 to match proportion
+
 
 # ─────────────────────────────────────────────────────────────
 # Unified loader + chunker
 # ─────────────────────────────────────────────────────────────
 
+def chunk_id(page_name: str, index: int) -> str:
+    """
+    Stable id of the index-th chunk of a clean_text file.
+    Used as FAISS docstore id so a file's vectors can be removed later.
+    """
+    return f"{page_name}::{index:04d}"
+
+
 def get_all_text_with_metadata(
-    chunk_size: int = 400,      # Reduced from 1000 for better granularity
-    chunk_overlap: int = 200,   # Reduced from 200 to match proportion
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    filenames: Optional[Iterable[str]] = None,
 ) -> List[Document]:
     """
     Load ALL .txt files from CLEAN_DIR, assign metadata,
@@ -138,6 +152,11 @@ def get_all_text_with_metadata(
     File naming convention:
       • pdf__<name>.txt  → PDF
       • anything_else   → Web
+
+    If `filenames` is given, only those files (names relative to CLEAN_DIR)
+    are loaded — used for incremental index updates.
+
+    Every chunk gets a stable metadata["chunk_id"] (see chunk_id()).
     
     Chunk size = 500 gives better granularity for precise retrieval
     while keeping each chunk focused on a single topic.
@@ -147,10 +166,16 @@ def get_all_text_with_metadata(
     web_files = 0
     pdf_files = 0
 
-    txt_files = sorted(
-        f for f in os.listdir(CLEAN_DIR)
-        if f.endswith(".txt")
-    )
+    if filenames is not None:
+        txt_files = sorted(
+            f for f in set(filenames)
+            if f.endswith(".txt") and os.path.isfile(os.path.join(CLEAN_DIR, f))
+        )
+    else:
+        txt_files = sorted(
+            f for f in os.listdir(CLEAN_DIR)
+            if f.endswith(".txt")
+        )
 
     if not txt_files:
         print(f"⚠️  No .txt files found in '{CLEAN_DIR}'")
@@ -207,6 +232,14 @@ def get_all_text_with_metadata(
 
     chunks = splitter.split_documents(documents)
 
+    # Number chunks per source file (split_documents keeps file order)
+    per_file = {}
+    for c in chunks:
+        name = c.metadata["page_name"]
+        idx = per_file.get(name, 0)
+        per_file[name] = idx + 1
+        c.metadata["chunk_id"] = chunk_id(name, idx)
+
     web_chunks = sum(
         1 for c in chunks if c.metadata.get("source_type") == "web"
     )